@@ -0,0 +1,339 @@
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import (
+    BinaryIO,
+    Callable,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from cache import DiskCache
+from profiling import span
+from resources import resource_path
+
+AudioFormat = Literal["wav", "mp3", "ogg"]
+
+BUFFER_SIZE = 1024 * 1024
+
+# What imported tracks are resampled to. The ffmpeg pipeline labels its output
+# with this rate instead.
+BFSTM_SAMPLE_RATE = 32000
+
+
+def _tool(name: str) -> str:
+    """The bundled executable, unless SMO_<NAME> points somewhere else."""
+    return os.environ.get(
+        f"SMO_{name.upper()}", resource_path(os.path.join("audio_tools", name + ".exe"))
+    )
+
+
+class Stage(NamedTuple):
+    """
+    One external tool in a Pipeline.
+
+    "{input}" and "{output}" in args are replaced with file paths. A stage that
+    reads stdin gets "-" as its input instead and a stage that writes stdout
+    gets no output path. input_suffix and output_suffix are the extensions the
+    tool needs on its files to detect their format.
+    """
+
+    args: Sequence[str]
+    stdin: bool = False
+    stdout: bool = False
+    input_suffix: str = ""
+    output_suffix: str = ""
+
+
+class Pipeline:
+    """
+    Runs stages one after another.
+
+    Consecutive stages are connected with a pipe when the first writes stdout
+    and the second reads stdin. Otherwise the data is streamed through a
+    bounded buffer into a file in a temporary directory, which is removed when
+    the run finishes, whether it succeeded or not.
+    """
+
+    def __init__(self, *stages: Stage) -> None:
+        self.stages = stages
+
+    def run(self, input_path: str, output: BinaryIO) -> None:
+        processes: List[Tuple[subprocess.Popen, List[str]]] = []
+        tools = [os.path.basename(stage.args[0]) for stage in self.stages]
+        with tempfile.TemporaryDirectory() as workspace:
+            try:
+                with span("audio pipeline", tools=tools):
+                    self._run(input_path, output, workspace, processes)
+            finally:
+                for process, _ in processes:
+                    if process.poll() is None:
+                        process.kill()
+                        process.wait()
+                    if process.stdout:
+                        process.stdout.close()
+
+    def _run(self, input_path, output, workspace, processes) -> None:
+        source_path: Optional[str] = input_path
+        source_pipe: Optional[BinaryIO] = None
+        for number, stage in enumerate(self.stages):
+            stdin = subprocess.DEVNULL
+            input_arg = source_path
+            if stage.stdin:
+                stdin = source_pipe or open(source_path, "rb")
+                input_arg = "-"
+            elif source_pipe is not None:
+                input_arg = os.path.join(workspace, f"{number}{stage.input_suffix}")
+                with open(input_arg, "wb") as f:
+                    shutil.copyfileobj(source_pipe, f, BUFFER_SIZE)
+                source_pipe.close()
+                source_pipe = None
+                self._wait(processes)
+
+            output_arg = ""
+            if not stage.stdout:
+                output_arg = os.path.join(
+                    workspace, f"{number}-out{stage.output_suffix}"
+                )
+            args = [
+                arg.replace("{input}", input_arg).replace("{output}", output_arg)
+                for arg in stage.args
+            ]
+            try:
+                process = subprocess.Popen(
+                    args,
+                    stdin=stdin,
+                    stdout=subprocess.PIPE if stage.stdout else subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            finally:
+                if stdin is not subprocess.DEVNULL:
+                    # The next process holds its own handle now, closing ours
+                    # lets the previous one see a broken pipe if it exits early.
+                    stdin.close()
+            processes.append((process, args))
+            if stage.stdout:
+                source_pipe = process.stdout
+                source_path = None
+            else:
+                self._wait(processes)
+                source_path = output_arg
+
+        if source_pipe is not None:
+            shutil.copyfileobj(source_pipe, output, BUFFER_SIZE)
+            source_pipe.close()
+        else:
+            with open(source_path, "rb") as f:
+                shutil.copyfileobj(f, output, BUFFER_SIZE)
+        self._wait(processes)
+
+    @staticmethod
+    def _wait(processes) -> None:
+        for process, args in processes:
+            if process.wait():
+                raise subprocess.CalledProcessError(process.returncode, args)
+
+
+class ConversionCache:
+    """
+    Finished conversions on disk, keyed by what determines their result: the
+    input's content, the pipeline's arguments (target format, loop count) and
+    the size and mtime of every tool it runs.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024) -> None:
+        self.blobs = DiskCache(directory, max_bytes)
+
+    @staticmethod
+    def key(input_path: str, pipeline: Pipeline) -> str:
+        digest = hashlib.sha256()
+        with open(input_path, "rb") as f:
+            for chunk in iter(lambda: f.read(BUFFER_SIZE), b""):
+                digest.update(chunk)
+        for stage in pipeline.stages:
+            digest.update(repr(list(stage)).encode())
+            try:
+                stat = os.stat(stage.args[0])
+                digest.update(f"{stat.st_size}|{stat.st_mtime_ns}".encode())
+            except OSError:
+                digest.update(b"missing")
+        return digest.hexdigest()
+
+    def run(self, pipeline: Pipeline, input_path: str, output: BinaryIO) -> None:
+        key = self.key(input_path, pipeline)
+        path = self.blobs.get_path(key)
+        if path is not None:
+            try:
+                with open(path, "rb") as f:
+                    shutil.copyfileobj(f, output, BUFFER_SIZE)
+                return
+            except FileNotFoundError:  # Evicted by another process meanwhile
+                pass
+        # Converted once, into a file that is copied to output and then kept.
+        path = self.blobs.temp_path()
+        try:
+            with open(path, "w+b") as f:
+                pipeline.run(input_path, f)
+                f.seek(0)
+                shutil.copyfileobj(f, output, BUFFER_SIZE)
+            self.blobs.put_file(key, path)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class AudioTools:
+    vgmstream = _tool("vgmstream")
+    vgaudio = _tool("vgaudio")
+    ffmpeg = _tool("ffmpeg")
+    oggenc = _tool("oggenc")
+    cache: Optional[ConversionCache] = None
+
+    def __init__(self, input_file: str) -> None:
+        self.input_file = input_file
+
+    @classmethod
+    def export_pipeline(cls, ext: AudioFormat) -> Pipeline:
+        decode = Stage([cls.vgmstream, "-p", "{input}"], stdout=True)
+        if ext == "wav":
+            return Pipeline(decode)
+        elif ext == "mp3":
+            return Pipeline(
+                decode,
+                Stage(
+                    [cls.ffmpeg, "-i", "-", "-f", "mp3", "-"], stdin=True, stdout=True
+                ),
+            )
+        elif ext == "ogg":
+            return Pipeline(
+                decode,
+                Stage([cls.oggenc, "-Q", "-o", "-", "-"], stdin=True, stdout=True),
+            )
+        raise ValueError(f"Unknown file format: {ext}")
+
+    @classmethod
+    def import_pipeline(cls, number_of_loops: int = 1) -> Pipeline:
+        return Pipeline(
+            # vgmstream needs to seek in its input, so this one goes to a file.
+            Stage(
+                [
+                    cls.ffmpeg,
+                    "-i",
+                    "{input}",
+                    "-af",
+                    "asetrate=32000",
+                    "{output}",
+                    "-y",
+                ],
+                output_suffix=".wav",
+            ),
+            Stage(
+                [
+                    cls.vgmstream,
+                    "-f",
+                    "0",
+                    "-l",
+                    str(number_of_loops),
+                    "-L",
+                    "-o",
+                    "{output}",
+                    "{input}",
+                ],
+                input_suffix=".wav",
+                output_suffix=".lwav",
+            ),
+            Stage(
+                [cls.vgaudio, "--little-endian", "{input}", "{output}"],
+                output_suffix=".bfstm",
+            ),
+        )
+
+    @classmethod
+    def wav_pipeline(cls) -> Pipeline:
+        """Any file ffmpeg reads to 16 bit WAV, at its own sample rate."""
+        return Pipeline(
+            Stage(
+                [cls.ffmpeg, "-i", "{input}", "-f", "wav", "-c:a", "pcm_s16le", "-"],
+                stdout=True,
+            )
+        )
+
+    def _run(self, pipeline: Pipeline, output: BinaryIO) -> None:
+        if self.cache is None:
+            pipeline.run(self.input_file, output)
+        else:
+            self.cache.run(pipeline, self.input_file, output)
+
+    def to_audio(self, output: BinaryIO, ext: AudioFormat = "wav") -> None:
+        """Convert the input bfstm to wav, mp3 or ogg."""
+        if ext == "wav":
+            from bfstm import Bfstm, BfstmError
+
+            try:
+                stream = Bfstm.open(self.input_file)
+            except BfstmError:
+                pass  # A codec only vgmstream knows
+            else:
+                with span("bfstm decode", file=self.input_file):
+                    stream.write_wav(output)
+                return
+        self._run(self.export_pipeline(ext), output)
+
+    def to_bfstm(self, output: BinaryIO, number_of_loops: int = 1) -> None:
+        """Convert the input wav, mp3 or ogg file to bfstm."""
+        self._run(self.import_pipeline(number_of_loops), output)
+
+    def to_looping_bfstm(self, output: BinaryIO) -> None:
+        """
+        Convert the input wav, mp3 or ogg file to a bfstm that loops in game,
+        with the audio stored once. The loop is the one in a WAV's smpl chunk,
+        otherwise the whole track.
+        """
+        from bfstm import read_wav, resample, write_bfstm
+
+        with open(self.input_file, "rb") as f:
+            data = f.read()
+        try:
+            pcm, sample_rate, loop = read_wav(data)
+        except ValueError:
+            converted = io.BytesIO()
+            self._run(self.wav_pipeline(), converted)
+            pcm, sample_rate, loop = read_wav(converted.getvalue())
+        with span("bfstm encode", file=self.input_file, seconds=len(pcm) / sample_rate):
+            pcm = resample(pcm, sample_rate, BFSTM_SAMPLE_RATE)
+            start, end = loop or (0, len(pcm))
+            start = start * BFSTM_SAMPLE_RATE // sample_rate
+            end = min(end * BFSTM_SAMPLE_RATE // sample_rate, len(pcm))
+            if start >= end:
+                start, end = 0, len(pcm)
+            write_bfstm(output, pcm, BFSTM_SAMPLE_RATE, (start, end))
+
+    def save_audio(self, path: str, ext: AudioFormat = "wav") -> None:
+        _write_through_temp(path, lambda f: self.to_audio(f, ext))
+
+    def save_bfstm(self, path: str, number_of_loops: int = 1) -> None:
+        _write_through_temp(path, lambda f: self.to_bfstm(f, number_of_loops))
+
+    def save_looping_bfstm(self, path: str) -> None:
+        _write_through_temp(path, self.to_looping_bfstm)
+
+
+def _write_through_temp(path: str, write: Callable[[BinaryIO], None]) -> None:
+    """Write next to path and only replace it once writing succeeded."""
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            write(f)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
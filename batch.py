@@ -0,0 +1,163 @@
+"""
+Export or import every track of the Music Editor without the GUI.
+
+    python batch.py export --romfs ROMFS --patches PATCHES --output DIR
+    python batch.py import --romfs ROMFS --patches PATCHES --mapping tracks.json
+
+The mapping file is a JSON object from ResourceName to a file. For imports the
+value may also be {"file": ..., "loops": N}. Relative paths are resolved
+against the directory of the mapping file.
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import byml
+from appdirs import user_config_dir
+
+from audio import AudioTools, ConversionCache
+from folders import resolve_file, validate
+from szs import decode_szs
+
+
+def resource_names(romfs_path: str, patches_path: str) -> List[str]:
+    """Every ResourceName used in BgmStageInfoList.byml, in order of appearance."""
+    archive = decode_szs(
+        resolve_file(
+            romfs_path, patches_path, os.path.join("SoundData", "BgmDataBase.szs")
+        )
+    )
+    stage_info_list = byml.Byml(bytes(archive["BgmStageInfoList.byml"])).parse()
+    names: Dict[str, None] = {}
+    for stage in stage_info_list["StageInfoList"]:
+        for scenario in stage["StageScenarioInfoList"]:
+            for music_info in scenario["StagePlayInfoList"]:
+                names[music_info["ResourceName"]] = None
+    return list(names)
+
+
+def stream_file(resource_name: str) -> str:
+    return os.path.join("SoundData", "stream", resource_name + ".bfstm")
+
+
+def export_track(source: str, destination: str) -> None:
+    extension = destination.split(".")[-1]
+    AudioTools(source).save_audio(
+        destination, extension if extension in ("mp3", "ogg") else "wav"
+    )
+
+
+def import_track(source: str, destination: str, number_of_loops: int) -> None:
+    AudioTools(source).save_bfstm(destination, number_of_loops)
+
+
+def load_mapping(path: Optional[str]) -> Dict[str, dict]:
+    if not path:
+        return {}
+    with open(path, "r") as f:
+        mapping = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    result = {}
+    for name, value in mapping.items():
+        if isinstance(value, str):
+            value = {"file": value}
+        result[name] = dict(value, file=os.path.join(base, value["file"]))
+    return result
+
+
+def use_cache(directory: Optional[str]) -> None:
+    AudioTools.cache = ConversionCache(directory) if directory else None
+
+
+def run(
+    jobs: Dict[str, Tuple], workers: Optional[int], cache: Optional[str] = None
+) -> Dict[str, str]:
+    """Run jobs (name -> (function, *args)) in a process pool, return failures."""
+    failures = {}
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=use_cache, initargs=(cache,)
+    ) as executor:
+        futures = {
+            executor.submit(job[0], *job[1:]): name for name, job in jobs.items()
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            name = futures[future]
+            try:
+                future.result()
+            except Exception as e:  # One broken track must not stop the batch
+                failures[name] = str(e) or type(e).__name__
+                status = f"failed: {failures[name]}"
+            else:
+                status = "done"
+            print(f"[{done}/{len(jobs)}] {name}: {status}", flush=True)
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("--romfs", required=True, help="Super Mario Odyssey RomFS")
+    parser.add_argument("--patches", required=True, help="Folder to save patches to")
+    parser.add_argument("--mapping", help="JSON file of ResourceName -> file")
+    parser.add_argument("--output", help="Folder to export to, by default .")
+    parser.add_argument(
+        "--format", choices=("wav", "mp3", "ogg"), default="wav", help="Export format"
+    )
+    parser.add_argument(
+        "--jobs", type=int, help="Parallel conversions, by default one per CPU"
+    )
+    parser.add_argument(
+        "--cache",
+        default=os.path.join(
+            user_config_dir("Super Mario Odyssey Modding Tool"), "conversion_cache"
+        ),
+        help="Conversion cache folder, shared with the GUI by default",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_const", const="", dest="cache", help="No cache"
+    )
+    args = parser.parse_args(argv)
+
+    error = validate(args.romfs, args.patches)
+    if error:
+        parser.error(error)
+    if args.command == "import" and not args.mapping:
+        parser.error("import needs a --mapping file")
+
+    names = resource_names(args.romfs, args.patches)
+    mapping = load_mapping(args.mapping)
+    unknown = sorted(set(mapping) - set(names))
+    if unknown:
+        print(f"Not in BgmStageInfoList.byml: {', '.join(unknown)}", file=sys.stderr)
+
+    jobs = {}
+    for name in names:
+        if args.command == "export":
+            if mapping and name not in mapping:
+                continue
+            destination = mapping.get(name, {}).get("file") or os.path.join(
+                args.output or ".", f"{name}.{args.format}"
+            )
+            source = resolve_file(args.romfs, args.patches, stream_file(name))
+            jobs[name] = (export_track, source, destination)
+        elif name in mapping:
+            jobs[name] = (
+                import_track,
+                mapping[name]["file"],
+                os.path.join(args.patches, stream_file(name)),
+                int(mapping[name].get("loops", 1)),
+            )
+
+    failures = run(jobs, args.jobs, args.cache)
+    print(f"{len(jobs) - len(failures)} of {len(jobs)} tracks converted")
+    for name, error in failures.items():
+        print(f"  {name}: {error}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""
+Time the hot paths of the tool on synthetic archives and audio, no game dump needed.
+
+    python bench.py [--members 64] [--nodes 2000] [--output results.json]
+    python bench.py --baseline results.json
+
+Every benchmark reports the median and best time of --repeat runs and its peak
+memory (traced in one extra run). With --baseline the results are compared to
+an earlier --output file, and the exit code is 1 if the best time of any
+benchmark got slower than --threshold times its baseline.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import byml
+import numpy as np
+
+import views
+import yaz0
+from bfstm import Bfstm, resample, write_bfstm
+from byml_patch import BymlPatcher
+from cache import SzsCache
+from sarc import SarcArchive
+from search import SearchIndex, TreeSearchIndex
+from szs import decode_szs, export_szs
+
+Benchmark = Callable[[], object]
+
+# What main.py imports before its window opens, heavy imports are deferred.
+STARTUP_MODULES = (
+    "imgui",
+    "pygui",
+    "appdirs",
+    "views",
+    "yaz0",
+    "audio",
+    "cache",
+    "eventloop",
+    "folders",
+    "jobs",
+    "memory_cache",
+    "preload",
+    "profiling",
+    "randomizer",
+    "resources",
+    "romfs_index",
+    "sarc",
+    "search",
+    "szs",
+    "vfs",
+)
+
+
+def startup_imports() -> None:
+    # A fresh interpreter, nothing is imported yet.
+    subprocess.run(
+        [sys.executable, "-c", "import " + ", ".join(STARTUP_MODULES)],
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+def shop_data(count: int, rng: random.Random) -> list:
+    return [
+        {
+            "ItemName": f"Item{i:05d}",
+            "StoreName": rng.choice(["All", "Cap", "Sand", "Lake"]),
+            "Price": byml.Int(rng.randrange(10000)),
+            "ItemType": rng.choice(["Cloth", "Sticker", "Souvenir"]),
+        }
+        for i in range(count)
+    ]
+
+
+def player_const(count: int, rng: random.Random) -> dict:
+    return {
+        f"Const{i:05d}": (
+            byml.Float(rng.random() * 100) if i % 2 else byml.Int(rng.randrange(1000))
+        )
+        for i in range(count)
+    }
+
+
+def bgm_stage_info_list(count: int, rng: random.Random) -> dict:
+    # Stages of 3 scenarios with 4 tracks each: about 16 nodes per scenario.
+    stages = []
+    for i in range(max(count // 64, 1)):
+        scenarios = []
+        for scenario_no in range(3):
+            tracks = [
+                {
+                    "Name": f"Track{j}",
+                    "ResourceName": f"BgmStage{i:03d}Track{rng.randrange(100):02d}",
+                }
+                for j in range(4)
+            ]
+            scenarios.append(
+                {"ScenarioNo": byml.Int(scenario_no), "StagePlayInfoList": tracks}
+            )
+        stages.append({"Name": f"Stage{i:03d}", "StageScenarioInfoList": scenarios})
+    return {"StageInfoList": stages}
+
+
+def member_data(size: int, rng: random.Random) -> bytes:
+    # Repetitive, like most game data, so Yaz0 has something to find.
+    words = [
+        bytes(rng.randrange(256) for _ in range(rng.randrange(2, 16)))
+        for _ in range(64)
+    ]
+    data = bytearray()
+    while len(data) < size:
+        data += rng.choice(words)
+    return bytes(data[:size])
+
+
+def tone(seconds: float, sample_rate: int) -> np.ndarray:
+    # A sweep and its reverse, so the predictors have something to follow.
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    sweep = np.sin(2 * np.pi * 220 * t * (1 + t))
+    return (np.stack([sweep, sweep[::-1]], axis=1) * 16000).astype(np.int16)
+
+
+def build_fixtures(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    fixtures = {
+        "shop_data": shop_data(args.nodes // 4, rng),
+        "player_const": player_const(args.nodes, rng),
+        "bgm_stage_info_list": bgm_stage_info_list(args.nodes, rng),
+    }
+    archive = SarcArchive()
+    for i in range(args.members):
+        archive[f"Member{i:04d}.bin"] = member_data(args.member_size, rng)
+    archive["ItemList.byml"] = byml.Writer(fixtures["shop_data"], True, 3).get_bytes()
+    archive["PlayerConst.byml"] = byml.Writer(
+        fixtures["player_const"], True, 3
+    ).get_bytes()
+    fixtures["sarc"] = archive.save()
+    fixtures["szs"] = yaz0.compress(fixtures["sarc"], "fast")
+    fixtures["pcm"] = tone(args.seconds, 32000)
+    fixtures["pcm_44100"] = tone(args.seconds, 44100)
+    bfstm = io.BytesIO()
+    write_bfstm(bfstm, fixtures["pcm"], 32000, (0, len(fixtures["pcm"])))
+    fixtures["bfstm"] = bfstm.getvalue()
+    return fixtures
+
+
+def benchmarks(fixtures: dict, directory: str) -> Dict[str, Benchmark]:
+    szs_path = os.path.join(directory, "Fixture.szs")
+    with open(szs_path, "wb") as f:
+        f.write(fixtures["szs"])
+    szs_cache = SzsCache(os.path.join(directory, "szs_cache"))
+    szs_cache.load(szs_path, lambda data: fixtures["sarc"])
+    archive = SarcArchive(fixtures["sarc"])
+    item_list = bytes(archive["ItemList.byml"])
+    shop = fixtures["shop_data"]
+    consts = fixtures["player_const"]
+    outputs = iter(range(sys.maxsize))
+
+    def export(level: yaz0.Level) -> Benchmark:
+        # A new file every run, an identical existing file is not written.
+        return lambda: export_szs(
+            archive, os.path.join(directory, f"out{next(outputs)}.szs"), level
+        )
+
+    patcher = BymlPatcher(item_list)
+
+    def patch_price() -> None:
+        patcher.apply({(0, "Price"): byml.Int(1234)})
+        patcher.get_bytes()
+
+    rows = views.music_rows(fixtures["bgm_stage_info_list"])
+    music_index = TreeSearchIndex(
+        [row.search_text for row in rows], [row.depth for row in rows]
+    )
+    stat_rows = views.stat_rows(consts)
+    stat_index = SearchIndex([row.search_text for row in stat_rows])
+    queries = ["", "t", "tr", "tra", "track1", "bgmstage00", "stage01", "zzz"]
+
+    def frame(index: SearchIndex, rows: list) -> Benchmark:
+        # What an editor does every frame besides drawing: search, then pick
+        # out the rows that fit on screen.
+        def run() -> None:
+            for query in queries:
+                found = index.search(query)
+                [rows[i] for i in found[:40]]
+
+        return run
+
+    return {
+        "startup_imports": startup_imports,
+        "decode_szs": lambda: decode_szs(szs_path),
+        "decode_szs_cached": lambda: decode_szs(szs_path, szs_cache),
+        "sarc_load": lambda: SarcArchive(fixtures["sarc"]),
+        "sarc_members": lambda: [bytes(archive[name]) for name in archive],
+        "sarc_save": archive.save,
+        "export_szs_fast": export("fast"),
+        "export_szs_balanced": export("balanced"),
+        "byml_parse": lambda: byml.Byml(item_list).parse(),
+        "byml_write": lambda: byml.Writer(shop, True, 3).get_bytes(),
+        "byml_patch_load": lambda: BymlPatcher(item_list),
+        "byml_patch_apply": patch_price,
+        "shop_rows": lambda: views.shop_rows(shop),
+        "stat_rows": lambda: views.stat_rows(consts),
+        "music_rows": lambda: views.music_rows(fixtures["bgm_stage_info_list"]),
+        "music_index": lambda: TreeSearchIndex(
+            [row.search_text for row in rows], [row.depth for row in rows]
+        ),
+        "frame_player_stat_editor": frame(stat_index, stat_rows),
+        "frame_music_editor": frame(music_index, rows),
+        "bfstm_decode": lambda: Bfstm(fixtures["bfstm"]).decode(),
+        "bfstm_encode": lambda: write_bfstm(
+            io.BytesIO(), fixtures["pcm"], 32000, (0, len(fixtures["pcm"]))
+        ),
+        "resample": lambda: resample(fixtures["pcm_44100"], 44100, 32000),
+    }
+
+
+def measure(benchmark: Benchmark, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        benchmark()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        benchmark()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "peak_bytes": peak,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Print a comparison with the baseline, return the benchmarks that regressed."""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        ratio = result["min"] / old["min"] if old["min"] else 1.0
+        memory = result["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else 1.0
+        slower = ratio > threshold
+        if slower:
+            regressions.append(name)
+        print(
+            f"{name:28} {ratio:6.2f}x time {memory:6.2f}x memory"
+            + ("  REGRESSION" if slower else "")
+        )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--members", type=int, default=64, help="SARC members")
+    parser.add_argument(
+        "--member-size", type=int, default=16 * 1024, help="Bytes per SARC member"
+    )
+    parser.add_argument("--nodes", type=int, default=2000, help="BYML values")
+    parser.add_argument(
+        "--seconds", type=float, default=5, help="Length of the audio fixtures"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="Fixture seed")
+    parser.add_argument("--only", nargs="*", help="Benchmarks to run, default all")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Slowdown that counts as a regression, by default 1.25",
+    )
+    args = parser.parse_args(argv)
+
+    fixtures = build_fixtures(args)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, benchmark in benchmarks(fixtures, directory).items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = result = measure(benchmark, args.repeat)
+            print(
+                f"{name:28} {result['median'] * 1000:10.3f} ms "
+                f"{result['peak_bytes'] / 1024:10.1f} KiB",
+                flush=True,
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "parameters": {
+                        "members": args.members,
+                        "member_size": args.member_size,
+                        "nodes": args.nodes,
+                        "repeat": args.repeat,
+                        "seed": args.seed,
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Slower than the baseline: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,736 @@
+"""
+Read and write BFSTM streams, without vgmstream or VGAudio.
+
+Only the INFO, SEEK and DATA blocks are needed. DSP-ADPCM is decoded and
+encoded with NumPy: every sample depends on the two before it, so samples are
+handled one position at a time, but for all channels of many blocks at once,
+each block starting from the history its SEEK entry records.
+"""
+
+import struct
+from math import gcd
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+PCM8 = 0
+PCM16 = 1
+DSP_ADPCM = 2
+
+INFO_BLOCK = 0x4000
+SEEK_BLOCK = 0x4001
+DATA_BLOCK = 0x4002
+
+SAMPLES_PER_FRAME = 14
+BYTES_PER_FRAME = 8
+
+
+class BfstmError(ValueError):
+    pass
+
+
+class StreamInfo(NamedTuple):
+    codec: int
+    loop: bool
+    channel_count: int
+    sample_rate: int
+    loop_start: int
+    sample_count: int  # Also where the loop ends
+    block_count: int
+    block_size: int
+    block_samples: int
+    last_block_size: int
+    last_block_samples: int
+    last_block_padded_size: int
+
+    @property
+    def duration(self) -> float:
+        return self.sample_count / self.sample_rate
+
+
+class DspChannel(NamedTuple):
+    coefficients: np.ndarray  # 8 pairs, as 16 int16
+    history: np.ndarray  # The two samples before the first one, newest first
+    loop_history: np.ndarray
+
+
+def decode_dsp_adpcm(
+    frames: np.ndarray, coefficients: np.ndarray, history: np.ndarray, samples: int
+) -> np.ndarray:
+    """
+    Decode rows of DSP-ADPCM frames side by side.
+
+    frames is (rows, bytes) of uint8, coefficients (rows, 16) and history
+    (rows, 2), newest sample first. Returns (rows, samples) of int16.
+    """
+    rows = frames.shape[0]
+    frame_count = -(-samples // SAMPLES_PER_FRAME)
+    frames = frames[:, : frame_count * BYTES_PER_FRAME]
+    frames = frames.reshape(rows, frame_count, BYTES_PER_FRAME).astype(np.int64)
+    header = frames[:, :, 0]
+    nibbles = np.empty((rows, frame_count, SAMPLES_PER_FRAME), np.int64)
+    nibbles[:, :, 0::2] = frames[:, :, 1:] >> 4
+    nibbles[:, :, 1::2] = frames[:, :, 1:] & 0xF
+    nibbles[nibbles >= 8] -= 16
+    # Everything but the history terms, which are what make this sequential.
+    scaled = ((nibbles << (header & 0xF)[:, :, None]) << 11) + 1024
+    pairs = coefficients.astype(np.int64).reshape(rows, 8, 2)
+    predictor = pairs[np.arange(rows)[:, None], (header >> 4) & 7]
+    predictor = np.repeat(predictor, SAMPLES_PER_FRAME, axis=1)
+
+    # Positions first, so each step reads contiguous rows.
+    scaled = np.ascontiguousarray(scaled.reshape(rows, -1)[:, :samples].T)
+    coefficient1 = np.ascontiguousarray(predictor[:, :samples, 0].T)
+    coefficient2 = np.ascontiguousarray(predictor[:, :samples, 1].T)
+    output = np.empty((samples, rows), np.int16)
+    history1 = history[:, 0].astype(np.int64)
+    history2 = history[:, 1].astype(np.int64)
+    for position in range(samples):
+        sample = coefficient1[position] * history1
+        sample += coefficient2[position] * history2
+        sample += scaled[position]
+        sample >>= 11
+        np.clip(sample, -32768, 32767, out=sample)
+        output[position] = sample
+        history1, history2 = sample, history1
+    return output.T
+
+
+class Bfstm:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        try:
+            self._read_header()
+        except BfstmError:
+            raise
+        except (struct.error, IndexError, ValueError) as e:
+            # Offsets or counts pointing past the end of a damaged file.
+            raise BfstmError(f"Invalid BFSTM: {e}") from None
+
+    def _read_header(self) -> None:
+        data = self.data
+        if data[:4] != b"FSTM":
+            raise BfstmError("This is not a BFSTM file")
+        boms = {b"\xfe\xff": ">", b"\xff\xfe": "<"}
+        try:
+            self.endianness = e = boms[data[4:6]]
+        except KeyError:
+            raise BfstmError("Invalid BFSTM byte order mark") from None
+        _, self.version, _, section_count = struct.unpack_from(e + "HIIH", data, 6)
+        sections = {}
+        for index in range(section_count):
+            kind, _, offset, size = struct.unpack_from(
+                e + "HHII", data, 0x14 + index * 12
+            )
+            sections[kind] = (offset, size)
+        if INFO_BLOCK not in sections or DATA_BLOCK not in sections:
+            raise BfstmError("The BFSTM has no INFO or DATA block")
+        self._read_info(sections[INFO_BLOCK][0])
+        self.data_offset += sections[DATA_BLOCK][0] + 8
+        self.seek = self._read_seek(sections.get(SEEK_BLOCK))
+        info = self.info
+        end = self.data_offset + info.block_size * info.channel_count * (
+            info.block_count - 1
+        )
+        end += info.last_block_padded_size * (info.channel_count - 1)
+        if end + info.last_block_size > len(data):
+            raise BfstmError("The BFSTM is cut short")
+
+    @classmethod
+    def open(cls, path: str) -> "Bfstm":
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    def _read_info(self, offset: int) -> None:
+        e = self.endianness
+        if self.data[offset : offset + 4] != b"INFO":
+            raise BfstmError("Invalid INFO block")
+        base = offset + 8
+        _, stream_offset, _, _, _, channels_offset = struct.unpack_from(
+            e + "HxxiHxxiHxxi", self.data, base
+        )
+        fields = struct.unpack_from(e + "BBBx11I", self.data, base + stream_offset)
+        self.info = StreamInfo(fields[0], bool(fields[1]), *fields[2:12])
+        # After the SEEK entry size and interval, where in DATA the samples are.
+        self.data_offset = struct.unpack_from(
+            e + "i", self.data, base + stream_offset + 0x34
+        )[0]
+        if self.info.codec not in (PCM8, PCM16, DSP_ADPCM):
+            raise BfstmError(f"Unsupported BFSTM codec {self.info.codec}")
+        if self.info.channel_count == 0 or self.info.block_count == 0:
+            raise BfstmError("The BFSTM has no audio")
+
+        self.channels: List[DspChannel] = []
+        if self.info.codec != DSP_ADPCM:
+            return
+        table = base + channels_offset
+        (count,) = struct.unpack_from(e + "I", self.data, table)
+        for index in range(count):
+            (channel_offset,) = struct.unpack_from(
+                e + "4xi", self.data, table + 4 + index * 8
+            )
+            channel = table + channel_offset
+            (adpcm_offset,) = struct.unpack_from(e + "4xi", self.data, channel)
+            values = struct.unpack_from(
+                e + "16hH2hH2h", self.data, channel + adpcm_offset
+            )
+            self.channels.append(
+                DspChannel(
+                    np.array(values[:16], np.int16),
+                    np.array(values[17:19], np.int16),
+                    np.array(values[20:22], np.int16),
+                )
+            )
+        if len(self.channels) != self.info.channel_count:
+            raise BfstmError("The BFSTM has the wrong number of channels")
+
+    def _read_seek(self, section) -> Optional[np.ndarray]:
+        """The history at the start of every block, (blocks, channels, 2)."""
+        if section is None or self.info.codec != DSP_ADPCM:
+            return None
+        offset, size = section
+        shape = (self.info.block_count, self.info.channel_count, 2)
+        if size - 8 < 4 * shape[0] * shape[1]:
+            return None
+        entries = np.frombuffer(
+            self.data,
+            self.endianness + "i2",
+            shape[0] * shape[1] * 2,
+            offset + 8,
+        )
+        return entries.reshape(shape)
+
+    def _block_bytes(self, start: int, stop: int) -> np.ndarray:
+        """Blocks start to stop as (blocks, channels, block_size) of uint8."""
+        info = self.info
+        full_stop = min(stop, info.block_count - 1)
+        stride = info.block_size * info.channel_count
+        blocks = np.frombuffer(
+            self.data,
+            np.uint8,
+            max(full_stop - start, 0) * stride,
+            self.data_offset + start * stride,
+        ).reshape(-1, info.channel_count, info.block_size)
+        if stop < info.block_count:
+            return blocks
+        # The last block is smaller, padded with silence it decodes the same.
+        last = np.zeros((1, info.channel_count, info.block_size), np.uint8)
+        offset = self.data_offset + (info.block_count - 1) * stride
+        for channel in range(info.channel_count):
+            start = offset + channel * info.last_block_padded_size
+            last[0, channel, : info.last_block_size] = np.frombuffer(
+                self.data, np.uint8, info.last_block_size, start
+            )
+        return np.concatenate((blocks, last))
+
+    def blocks(self, blocks_per_chunk: int = 64) -> Iterator[np.ndarray]:
+        """
+        Decode the stream a chunk of blocks at a time, as (samples, channels)
+        of int16.
+        """
+        info = self.info
+        # Without SEEK entries a block needs the end of the one before it.
+        if self.seek is None:
+            blocks_per_chunk = 1
+        history = None
+        if self.channels:
+            history = np.array([channel.history for channel in self.channels])
+        for start in range(0, info.block_count, blocks_per_chunk):
+            stop = min(start + blocks_per_chunk, info.block_count)
+            raw = self._block_bytes(start, stop)
+            count = stop - start
+            if info.codec == DSP_ADPCM:
+                if self.seek is not None:
+                    history = self.seek[start:stop]
+                coefficients = np.array([c.coefficients for c in self.channels])
+                samples = decode_dsp_adpcm(
+                    raw.reshape(count * info.channel_count, -1),
+                    np.tile(coefficients, (count, 1)),
+                    np.reshape(history, (-1, 2)),
+                    info.block_samples,
+                ).reshape(count, info.channel_count, -1)
+                history = samples[-1, :, :-3:-1]
+            elif info.codec == PCM16:
+                samples = raw.view(self.endianness + "i2").astype(np.int16)
+            else:
+                samples = raw.view(np.int8).astype(np.int16) << 8
+            samples = samples[:, :, : info.block_samples]
+            pcm = samples.transpose(0, 2, 1).reshape(-1, info.channel_count)
+            if stop == info.block_count:
+                pcm = pcm[: (count - 1) * info.block_samples + info.last_block_samples]
+            yield pcm
+
+    def decode(self) -> np.ndarray:
+        return np.concatenate(list(self.blocks()))
+
+    def write_wav(self, output: BinaryIO) -> None:
+        """
+        Write the stream as 16 bit WAV, played once. Loop points go in a smpl
+        chunk, which most audio editors and vgmstream read.
+        """
+        info = self.info
+        channels = info.channel_count
+        data_size = info.sample_count * channels * 2
+        chunks = struct.pack(
+            "<4sIHHIIHH",
+            b"fmt ",
+            16,
+            1,
+            channels,
+            info.sample_rate,
+            info.sample_rate * channels * 2,
+            channels * 2,
+            16,
+        )
+        if info.loop:
+            chunks += struct.pack(
+                "<4sI9I6I",
+                b"smpl",
+                60,
+                *(0, 0, 1_000_000_000 // info.sample_rate, 60, 0, 0, 0, 1, 0),
+                *(0, 0, info.loop_start, info.sample_count - 1, 0, 0),
+            )
+        output.write(
+            struct.pack("<4sI4s", b"RIFF", 4 + len(chunks) + 8 + data_size, b"WAVE")
+        )
+        output.write(chunks)
+        output.write(struct.pack("<4sI", b"data", data_size))
+        for pcm in self.blocks():
+            output.write(pcm.astype("<i2").tobytes())
+
+
+def waveform(stream: Bfstm, points: int = 1024, progress=None) -> np.ndarray:
+    """
+    The loudest sample of any channel in each of points slices of the stream,
+    from 0 to 1. progress(fraction) is called as the stream is decoded.
+    """
+    peaks = np.empty(stream.info.sample_count, np.int16)
+    done = 0
+    for pcm in stream.blocks():
+        loudest = np.abs(pcm.astype(np.int32)).max(axis=1)
+        peaks[done : done + len(pcm)] = np.minimum(loudest, 32767)
+        done += len(pcm)
+        if progress is not None:
+            progress(done / stream.info.sample_count)
+    slices = np.array_split(peaks, min(points, len(peaks)))
+    return np.array([s.max() for s in slices], np.float32) / 32767
+
+
+def read_wav(data: bytes) -> Tuple[np.ndarray, int, Optional[Tuple[int, int]]]:
+    """
+    The samples of a 16 bit PCM WAV as (samples, channels) of int16, its
+    sample rate and the loop in its smpl chunk (end exclusive), if any.
+    """
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("This is not a WAV file")
+    offset = 12
+    fmt = samples = loop = None
+    while offset + 8 <= len(data):
+        kind, size = struct.unpack_from("<4sI", data, offset)
+        # Streamed WAVs (like ffmpeg writing to a pipe) don't know their sizes.
+        size = min(size, len(data) - offset - 8)
+        body = offset + 8
+        if kind == b"fmt ":
+            fmt = struct.unpack_from("<HHI6xH", data, body)
+        elif kind == b"data":
+            samples = data[body : body + size]
+        elif kind == b"smpl" and size >= 60:
+            (count,) = struct.unpack_from("<I", data, body + 28)
+            if count:
+                start, end = struct.unpack_from("<II", data, body + 44)
+                loop = (start, end + 1)
+        offset = body + size + (size & 1)
+    if fmt is None or samples is None:
+        raise ValueError("The WAV has no fmt or data chunk")
+    encoding, channels, sample_rate, bits = fmt
+    if encoding not in (1, 0xFFFE) or bits != 16 or not channels:
+        raise ValueError("Only 16 bit PCM WAVs can be read")
+    frame_size = channels * 2
+    pcm = np.frombuffer(samples, "<i2", len(samples) // frame_size * channels)
+    pcm = pcm.reshape(-1, channels).astype(np.int16)
+    if loop is not None and not 0 <= loop[0] < loop[1] <= len(pcm):
+        loop = None
+    return pcm, sample_rate, loop
+
+
+def resample(
+    pcm: np.ndarray, source_rate: int, target_rate: int, taps: int = 32
+) -> np.ndarray:
+    """
+    Resample (samples, channels) of int16 with a Blackman windowed sinc.
+
+    Output samples repeat the same fractional positions in the input every
+    target_rate / gcd of the rates samples, so there are only that many sets of
+    weights, each applied to every sample of its phase at once.
+    """
+    if source_rate == target_rate or not len(pcm):
+        return pcm
+    divisor = gcd(source_rate, target_rate)
+    up, down = target_rate // divisor, source_rate // divisor
+    # Downsampling filters out what the new rate can't hold, over more taps.
+    cutoff = min(1.0, up / down)
+    half = int(np.ceil(taps / 2 / cutoff))
+    offsets = np.arange(1 - half, half + 1)
+    positions = np.arange(up) * down / up
+    nearest = np.floor(positions).astype(np.int64)
+    distance = (positions - nearest)[:, None] - offsets
+    window = 0.42 + 0.5 * np.cos(np.pi * distance / half)
+    window += 0.08 * np.cos(2 * np.pi * distance / half)
+    weights = cutoff * np.sinc(cutoff * distance) * window
+    weights = (weights / weights.sum(axis=1, keepdims=True)).astype(np.float32)
+
+    padded = np.pad(pcm.astype(np.float32), ((half, half + down), (0, 0)))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, len(offsets), axis=0)
+    count = len(pcm) * up // down
+    output = np.empty((count, pcm.shape[1]), np.int16)
+    for phase in range(min(up, count)):
+        # Output phase + k * up is around input nearest[phase] + k * down.
+        selected = windows[nearest[phase] + 1 :: down][: len(range(phase, count, up))]
+        samples = selected @ weights[phase]
+        output[phase::up] = np.clip(np.rint(samples), -32768, 32767)
+    return output
+
+
+def dsp_coefficients(pcm: np.ndarray, iterations: int = 8) -> np.ndarray:
+    """
+    Eight predictor pairs for one channel, as 16 int16 in 1/2048ths.
+
+    Every frame gets the pair that predicts it best, then every pair is
+    refitted to the frames it got, like k-means on the prediction error.
+    """
+    x = np.pad(pcm.astype(np.float64), (2, -len(pcm) % SAMPLES_PER_FRAME))
+    frames = (len(x) - 2) // SAMPLES_PER_FRAME
+
+    def lagged(lag: int) -> np.ndarray:
+        return x[2 - lag : len(x) - lag].reshape(frames, SAMPLES_PER_FRAME)
+
+    x0, x1, x2 = lagged(0), lagged(1), lagged(2)
+    # Per frame, the sums that give the squared error of any pair.
+    r = np.stack([(x0 * x1).sum(1), (x0 * x2).sum(1)], axis=1)
+    big_r = np.empty((frames, 2, 2))
+    big_r[:, 0, 0] = (x1 * x1).sum(1)
+    big_r[:, 0, 1] = big_r[:, 1, 0] = (x1 * x2).sum(1)
+    big_r[:, 1, 1] = (x2 * x2).sum(1)
+
+    def fit(r: np.ndarray, big_r: np.ndarray) -> np.ndarray:
+        # A little regularization keeps silent and constant frames solvable.
+        trace = np.trace(big_r, axis1=-2, axis2=-1)[..., None, None]
+        big_r = big_r + np.eye(2) * (trace * 1e-6 + 1)
+        pairs = np.linalg.solve(big_r, r[..., None])[..., 0]
+        # Keep every predictor stable.
+        pairs[..., 1] = np.clip(pairs[..., 1], -0.998, 0.998)
+        limit = (1 - pairs[..., 1]) * 0.998
+        pairs[..., 0] = np.clip(pairs[..., 0], -limit, limit)
+        return pairs
+
+    loud = big_r[:, 0, 0] > 0
+    if not loud.any():
+        return np.zeros(16, np.int16)
+    own = fit(r[loud], big_r[loud])
+    order = np.argsort(own[:, 0])
+    pairs = own[order[np.linspace(0, len(order) - 1, 8).astype(np.int64)]]
+    for _ in range(iterations):
+        error = -2 * r @ pairs.T + np.einsum("kp,fpq,kq->fk", pairs, big_r, pairs)
+        nearest = error.argmin(axis=1)
+        for index in range(8):
+            mask = nearest == index
+            if mask.any():
+                pairs[index] = fit(r[mask].sum(0), big_r[mask].sum(0))
+    return np.clip(np.rint(pairs * 2048), -32768, 32767).astype(np.int16).ravel()
+
+
+def encode_dsp_adpcm(
+    samples: np.ndarray, coefficients: np.ndarray, history: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encode rows of samples side by side, the counterpart of decode_dsp_adpcm.
+
+    samples is (rows, samples), a whole number of frames. Every frame tries
+    each predictor, at the scale its residual needs, and keeps the one that
+    decodes closest to the input.
+    Returns (rows, frames, 8) of uint8 and the last two decoded samples of
+    every row, (rows, 2) newest first.
+    """
+    rows = samples.shape[0]
+    frames = samples.shape[1] // SAMPLES_PER_FRAME
+    # int32 is enough for stable predictors, which coefficients keeps them.
+    samples = samples.astype(np.int32).reshape(rows, frames, SAMPLES_PER_FRAME)
+    pairs = coefficients.astype(np.int32).reshape(rows, 8, 2)
+    coefficient1, coefficient2 = pairs[:, :, 0], pairs[:, :, 1]
+    history1 = history[:, 0].astype(np.int32)
+    history2 = history[:, 1].astype(np.int32)
+    every_row = np.arange(rows)
+    output = np.empty((rows, frames, BYTES_PER_FRAME), np.uint8)
+    nibbles = np.empty((SAMPLES_PER_FRAME, rows, 8), np.int32)
+    for frame in range(frames):
+        x = samples[:, frame]
+        # The scale the residual of the input itself needs.
+        previous1 = np.concatenate((history1[:, None], x[:, :-1]), axis=1)
+        previous2 = np.concatenate(
+            (history2[:, None], history1[:, None], x[:, :-2]), axis=1
+        )
+        predicted = coefficient1[:, :, None] * previous1[:, None]
+        predicted += coefficient2[:, :, None] * previous2[:, None]
+        residual = np.abs(x[:, None] - ((predicted + 1024) >> 11)).max(axis=2)
+        scale = np.ceil(np.log2(np.maximum(residual, 1) / 7)).astype(np.int32)
+        scale = np.clip(scale, 0, 12)
+        half_step = (1 << scale) >> 1
+
+        # Then the real thing, predicting from what the decoder will have.
+        last1 = np.repeat(history1[:, None], 8, axis=1)
+        last2 = np.repeat(history2[:, None], 8, axis=1)
+        error = np.zeros((rows, 8), np.float32)
+        for position in range(SAMPLES_PER_FRAME):
+            prediction = coefficient1 * last1
+            prediction += coefficient2 * last2
+            prediction += 1024
+            prediction >>= 11
+            target = x[:, position, None]
+            # The nibble closest to the difference, rounding halves up.
+            nibble = nibbles[position]
+            np.subtract(target, prediction, out=nibble)
+            nibble += half_step
+            nibble >>= scale
+            np.clip(nibble, -8, 7, out=nibble)
+            decoded = nibble << scale
+            decoded += prediction
+            np.clip(decoded, -32768, 32767, out=decoded)
+            difference = (target - decoded).astype(np.float32)
+            error += difference * difference
+            last1, last2 = decoded, last1
+
+        best = error.argmin(axis=1)
+        chosen = nibbles[:, every_row, best].T & 0xF
+        output[:, frame, 0] = (best << 4) | scale[every_row, best]
+        output[:, frame, 1:] = (chosen[:, 0::2] << 4) | chosen[:, 1::2]
+        history1 = last1[every_row, best]
+        history2 = last2[every_row, best]
+    return output, np.stack((history1, history2), axis=1).astype(np.int16)
+
+
+def _align_loop(
+    pcm: np.ndarray, loop: Tuple[int, int], block_samples: int
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Move the loop start to the start of a block, where the decoder can jump
+    to, by playing that much more of the loop before jumping back.
+    """
+    start, end = loop
+    aligned = -(-start // block_samples) * block_samples
+    extra = start + np.arange(aligned - start) % (end - start)
+    return np.concatenate((pcm[:end], pcm[extra])), (aligned, end + aligned - start)
+
+
+def _encode_blocks(
+    encoded: np.ndarray,
+    encoded_from: np.ndarray,
+    seek: np.ndarray,
+    blocks: np.ndarray,
+    coefficients: np.ndarray,
+    chunk: np.ndarray,
+) -> None:
+    """
+    Encode blocks chunk from their SEEK history, and make the decoded end of
+    each the SEEK history of the block after it.
+    """
+    count, channel_count = len(chunk), blocks.shape[2]
+    if not count:
+        return
+    encoded_from[chunk] = seek[chunk]
+    frames, history = encode_dsp_adpcm(
+        blocks[chunk].transpose(0, 2, 1).reshape(count * channel_count, -1),
+        np.tile(coefficients, (count, 1)),
+        seek[chunk].reshape(-1, 2),
+    )
+    encoded[chunk] = frames.reshape(count, channel_count, -1)
+    history = history.reshape(count, channel_count, 2)
+    following = chunk + 1 < len(blocks)
+    seek[chunk[following] + 1] = history[following]
+
+
+def write_bfstm(
+    output: BinaryIO,
+    pcm: np.ndarray,
+    sample_rate: int,
+    loop: Optional[Tuple[int, int]] = None,
+    blocks_per_chunk: int = 128,
+) -> None:
+    """
+    Write (samples, channels) of int16 as a little endian DSP-ADPCM BFSTM.
+    The audio is stored once, a loop is only its start and end in the header.
+    """
+    block_size = 0x2000
+    block_samples = block_size // BYTES_PER_FRAME * SAMPLES_PER_FRAME
+    channel_count = pcm.shape[1]
+    if loop is not None:
+        pcm, loop = _align_loop(pcm, loop, block_samples)
+    sample_count = len(pcm)
+    if not sample_count:
+        raise ValueError("There is no audio to write")
+    block_count = -(-sample_count // block_samples)
+    last_block_samples = sample_count - (block_count - 1) * block_samples
+    last_block_size = -(-last_block_samples // SAMPLES_PER_FRAME) * BYTES_PER_FRAME
+    last_block_padded_size = -(-last_block_size // 0x20) * 0x20
+
+    coefficients = np.array([dsp_coefficients(pcm[:, c]) for c in range(channel_count)])
+    padded = np.zeros((block_count * block_samples, channel_count), np.int16)
+    padded[:sample_count] = pcm
+    blocks = padded.reshape(block_count, block_samples, channel_count)
+    # A block has to start from what the decoder has at the end of the block
+    # before, which is also what its SEEK entry says. Guessing the input there
+    # lets every block be encoded side by side first.
+    seek = np.zeros((block_count, channel_count, 2), np.int16)
+    seek[1:, :, 0] = blocks[:-1, -1]
+    seek[1:, :, 1] = blocks[:-1, -2]
+    encoded = np.empty((block_count, channel_count, block_size), np.uint8)
+    encoded_from = np.empty_like(seek)
+    for start in range(0, block_count, blocks_per_chunk):
+        chunk = np.arange(start, min(start + blocks_per_chunk, block_count))
+        _encode_blocks(encoded, encoded_from, seek, blocks, coefficients, chunk)
+    # Then the blocks whose guess was off are encoded again, until nothing
+    # changes. Each pass settles at least the first block still off. A new
+    # history mostly leads to the same decoded samples within a few frames,
+    # from where the block is encoded as before, so only its start changes.
+    prefix = 128 * SAMPLES_PER_FRAME
+    while True:
+        off = (seek[1:] != encoded_from[1:]).any(axis=(1, 2))
+        todo = np.flatnonzero(off) + 1
+        if not len(todo):
+            break
+        for start in range(0, len(todo), blocks_per_chunk):
+            chunk = todo[start : start + blocks_per_chunk]
+            count = len(chunk)
+            rows = count * channel_count
+            tiled = np.tile(coefficients, (count, 1))
+            before = decode_dsp_adpcm(
+                encoded[chunk].reshape(rows, -1),
+                tiled,
+                encoded_from[chunk].reshape(-1, 2),
+                prefix,
+            )[:, :-3:-1]
+            frames, after = encode_dsp_adpcm(
+                blocks[chunk, :prefix].transpose(0, 2, 1).reshape(rows, -1),
+                tiled,
+                seek[chunk].reshape(-1, 2),
+            )
+            same = (before == after).all(axis=1).reshape(count, channel_count)
+            same = same.all(axis=1)
+            spliced = chunk[same]
+            encoded[spliced, :, : prefix // SAMPLES_PER_FRAME * BYTES_PER_FRAME] = (
+                frames.reshape(count, channel_count, -1)[same]
+            )
+            encoded_from[spliced] = seek[spliced]
+            _encode_blocks(
+                encoded, encoded_from, seek, blocks, coefficients, chunk[~same]
+            )
+
+    loop_block = loop[0] // block_samples if loop is not None else 0
+    e = "<"
+    # INFO: references, stream info, track info, channel info, ADPCM info.
+    track_count = -(-channel_count // 2)
+    stream_info = 0x18
+    track_table = stream_info + 0x50
+    tracks = track_table + 4 + track_count * 8
+    channel_table = tracks + track_count * 0x14
+    channels = channel_table + 4 + channel_count * 8
+    adpcm = channels + channel_count * 8
+    info = bytearray(adpcm + channel_count * 0x30)
+    struct.pack_into(
+        e + "HxxiHxxiHxxi",
+        info,
+        0,
+        *(0x4100, stream_info, 0x0101, track_table, 0x0101, channel_table),
+    )
+    struct.pack_into(
+        e + "BBBx11IHxxiHxxHxxiII",
+        info,
+        stream_info,
+        DSP_ADPCM,
+        loop is not None,
+        channel_count,
+        sample_rate,
+        loop[0] if loop is not None else 0,
+        sample_count,
+        block_count,
+        block_size,
+        block_samples,
+        last_block_size,
+        last_block_samples,
+        last_block_padded_size,
+        4,
+        block_samples,
+        *(0x1F00, 0x18),  # Sample data, from the start of DATA's contents
+        *(0, 0, -1),  # No regions
+        loop[0] if loop is not None else 0,
+        loop[1] if loop is not None else 0,
+    )
+    struct.pack_into(e + "I", info, track_table, track_count)
+    for track in range(track_count):
+        # A track is a stereo pair at full volume and centered, followed by
+        # the list of its channels.
+        offset = tracks + track * 0x14
+        struct.pack_into(
+            e + "Hxxi", info, track_table + 4 + track * 8, 0x4101, offset - track_table
+        )
+        struct.pack_into(e + "BBBxHxxi", info, offset, 127, 64, 0, 0x0100, 0xC)
+        indices = range(track * 2, min(track * 2 + 2, channel_count))
+        struct.pack_into(e + "I", info, offset + 0xC, len(indices))
+        info[offset + 0x10 : offset + 0x10 + len(indices)] = bytes(indices)
+    struct.pack_into(e + "I", info, channel_table, channel_count)
+    for channel in range(channel_count):
+        entry = channels + channel * 8
+        struct.pack_into(
+            e + "Hxxi",
+            info,
+            channel_table + 4 + channel * 8,
+            0x4102,
+            entry - channel_table,
+        )
+        struct.pack_into(
+            e + "Hxxi", info, entry, 0x0300, adpcm + channel * 0x30 - entry
+        )
+        struct.pack_into(
+            e + "16hH2hH2h",
+            info,
+            adpcm + channel * 0x30,
+            *coefficients[channel],
+            encoded[0, channel, 0],
+            0,
+            0,
+            encoded[loop_block, channel, 0],
+            *seek[loop_block, channel],
+        )
+
+    seek_data = seek.astype(e + "i2").tobytes()
+    data = bytearray(0x18)
+    data += encoded[:-1].tobytes()
+    for channel in range(channel_count):
+        data += encoded[-1, channel, :last_block_padded_size].tobytes()
+
+    sections = []
+    for kind, magic, body in (
+        (INFO_BLOCK, b"INFO", info),
+        (SEEK_BLOCK, b"SEEK", seek_data),
+        (DATA_BLOCK, b"DATA", data),
+    ):
+        size = -(-(len(body) + 8) // 0x20) * 0x20
+        section = magic + struct.pack(e + "I", size) + bytes(body)
+        sections.append((kind, section + bytes(size - len(section))))
+    header_size = 0x40
+    file_size = header_size + sum(len(section) for _, section in sections)
+    header = bytearray(header_size)
+    struct.pack_into(
+        e + "4s2sHIIH",
+        header,
+        0,
+        *(b"FSTM", b"\xff\xfe", header_size, 0x00060100, file_size, len(sections)),
+    )
+    offset = header_size
+    for index, (kind, section) in enumerate(sections):
+        struct.pack_into(
+            e + "HxxII", header, 0x14 + index * 12, kind, offset, len(section)
+        )
+        offset += len(section)
+    output.write(header)
+    for _, section in sections:
+        output.write(section)
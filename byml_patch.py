@@ -0,0 +1,121 @@
+import struct
+from collections import Counter
+from typing import Dict, Hashable, Tuple, Union
+
+import byml
+from byml import NodeType
+
+Path = Tuple[Hashable, ...]
+Buffer = Union[bytes, bytearray, memoryview]
+
+_FORMATS = {
+    NodeType.INT: "i",
+    NodeType.FLOAT: "f",
+    NodeType.UINT: "I",
+    NodeType.INT64: "q",
+    NodeType.UINT64: "Q",
+    NodeType.DOUBLE: "d",
+}
+
+_TYPES = {
+    byml.Int: NodeType.INT,
+    byml.Float: NodeType.FLOAT,
+    byml.UInt: NodeType.UINT,
+    byml.Int64: NodeType.INT64,
+    byml.UInt64: NodeType.UINT64,
+    byml.Double: NodeType.DOUBLE,
+}
+
+
+class BymlPatcher:
+    """
+    A BYML document that knows where its fixed size values are stored.
+
+    Int, Float, UInt, Int64, UInt64 and Double values can then be changed by
+    overwriting their bytes, which leaves the rest of the file byte for byte
+    as it was. Anything else (other types, new keys, values stored once and
+    shared by several nodes) needs the document to be written again.
+    """
+
+    def __init__(self, data: Buffer) -> None:
+        self.load(data)
+
+    def load(self, data: Buffer) -> None:
+        self.data = bytearray(data)
+        magic = bytes(self.data[:2])
+        if magic not in (b"BY", b"YB"):
+            raise ValueError(f"Invalid magic: {magic!r} (expected 'BY' or 'YB')")
+        self._endian = ">" if magic == b"BY" else "<"
+        self.offsets: Dict[Path, Tuple[int, int]] = {}
+        self._keys = self._string_table(self._u32(4))
+        root = self._u32(12)
+        if root:
+            self._walk(self.data[root], root, ())
+        # Nodes stored once but referenced from several places can't be
+        # changed for one of them only.
+        counts = Counter(offset for _, offset in self.offsets.values())
+        self.offsets = {
+            path: entry for path, entry in self.offsets.items() if counts[entry[1]] == 1
+        }
+
+    def _u32(self, offset: int) -> int:
+        return struct.unpack_from(self._endian + "I", self.data, offset)[0]
+
+    def _u24(self, offset: int) -> int:
+        if self._endian == ">":
+            return int.from_bytes(self.data[offset : offset + 3], "big")
+        return int.from_bytes(self.data[offset : offset + 3], "little")
+
+    def _string_table(self, offset: int) -> list:
+        if not offset:
+            return []
+        strings = []
+        for i in range(self._u24(offset + 1)):
+            start = offset + self._u32(offset + 4 + 4 * i)
+            end = self.data.index(0, start)
+            strings.append(self.data[start:end].decode("utf-8"))
+        return strings
+
+    def _value(self, node_type: int, slot: int, path: Path) -> None:
+        if node_type in (NodeType.ARRAY, NodeType.HASH):
+            offset = self._u32(slot)
+            self._walk(node_type, offset, path)
+        elif node_type in (NodeType.INT, NodeType.FLOAT, NodeType.UINT):
+            self.offsets[path] = (node_type, slot)
+        elif node_type in (NodeType.INT64, NodeType.UINT64, NodeType.DOUBLE):
+            self.offsets[path] = (node_type, self._u32(slot))
+
+    def _walk(self, node_type: int, offset: int, path: Path) -> None:
+        count = self._u24(offset + 1)
+        if node_type == NodeType.ARRAY:
+            values = offset + 4 + (count + 3) // 4 * 4
+            for i in range(count):
+                self._value(self.data[offset + 4 + i], values + 4 * i, path + (i,))
+        elif node_type == NodeType.HASH:
+            for i in range(count):
+                entry = offset + 4 + 8 * i
+                key = self._keys[self._u24(entry)]
+                self._value(self.data[entry + 3], entry + 4, path + (key,))
+
+    def apply(self, changes: Dict[Path, object]) -> bool:
+        """
+        Write changed values in place. Either all of them are written and True
+        is returned, or none are and the document has to be rewritten instead.
+        """
+        packed = []
+        for path, value in changes.items():
+            entry = self.offsets.get(path)
+            if entry is None or _TYPES.get(type(value)) != entry[0]:
+                return False
+            node_type, offset = entry
+            try:
+                data = struct.pack(self._endian + _FORMATS[node_type], value)
+            except struct.error:
+                return False
+            packed.append((offset, data))
+        for offset, data in packed:
+            self.data[offset : offset + len(data)] = data
+        return True
+
+    def get_bytes(self) -> bytes:
+        return bytes(self.data)
@@ -0,0 +1,245 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List, Optional
+
+# Hits only move access times, saved at most this often. Puts, evictions and
+# removals save right away.
+SAVE_INTERVAL = 30.0
+# Temp files nobody wrote to for this long were left by a process that died.
+STALE_TEMP_SECONDS = 3600.0
+
+
+# Caches whose access times are saved at exit, without keeping them alive.
+_open_caches: "weakref.WeakSet[DiskCache]" = weakref.WeakSet()
+
+
+def _flush_all() -> None:
+    for cache in list(_open_caches):
+        cache.flush()
+
+
+atexit.register(_flush_all)
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+class DiskCache:
+    """
+    A directory of blobs keyed by hex digest, capped at max_bytes.
+
+    Least recently used blobs are evicted first. Sizes and access times live in
+    index.json next to the blobs.
+    """
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(directory, "index.json")
+        self._entries: Dict[str, List[float]] = {}  # key -> [size, last used]
+        self._saved_at = time.monotonic()
+        self._dirty = False
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self._index_path, "r") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+        self._reconcile()
+        _open_caches.add(self)
+
+    def _reconcile(self) -> None:
+        # Another process may have written blobs and lost the race to save its
+        # index, so pick up blobs the index does not know about and drop
+        # entries whose blob is gone.
+        blobs = {}
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if len(entry.name) == 64 and entry.is_file():
+                stat = entry.stat()
+                blobs[entry.name] = [stat.st_size, stat.st_mtime]
+            elif entry.name.endswith(".tmp") and entry.is_file():
+                try:
+                    if now - entry.stat().st_mtime > STALE_TEMP_SECONDS:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+        self._entries = {key: self._entries.get(key, blobs[key]) for key in blobs}
+
+    @property
+    def size(self) -> int:
+        return int(sum(size for size, _ in self._entries.values()))
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries and os.path.exists(self.path(key))
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            try:
+                with open(self.path(key), "rb") as f:
+                    data = f.read()
+            except OSError:
+                del self._entries[key]
+                self._save_index()
+                return None
+            self._touch(key)
+            return data
+
+    def get_path(self, key: str) -> Optional[str]:
+        """Like get, but return the blob's path instead of reading it."""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            if not os.path.exists(self.path(key)):
+                del self._entries[key]
+                self._save_index()
+                return None
+            self._touch(key)
+            return self.path(key)
+
+    def temp_path(self) -> str:
+        """A path in the cache directory to write a blob to for put_file."""
+        return os.path.join(
+            self.directory, f"{os.getpid()}.{threading.get_ident()}.{time.time()}.tmp"
+        )
+
+    def put_file(self, key: str, path: str) -> None:
+        """Move the file at path into the cache."""
+        size = os.path.getsize(path)
+        if size > self.max_bytes:
+            os.remove(path)
+            return
+        with self._lock:
+            os.replace(path, self.path(key))
+            self._entries[key] = [size, time.time()]
+            self._evict()
+            self._save_index()
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            _write_atomic(self.path(key), data)
+            self._entries[key] = [len(data), time.time()]
+            self._evict()
+            self._save_index()
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+            self._save_index()
+
+    def _remove(self, key: str) -> None:
+        self._entries.pop(key, None)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        total = self.size
+        for key in sorted(self._entries, key=lambda key: self._entries[key][1]):
+            if total <= self.max_bytes:
+                break
+            total -= self._entries[key][0]
+            self._remove(key)
+
+    def _touch(self, key: str) -> None:
+        self._entries[key][1] = time.time()
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+            self._save_index()
+
+    def flush(self) -> None:
+        """Save access times that were only kept in memory, if possible."""
+        with self._lock:
+            if self._dirty:
+                try:
+                    self._save_index()
+                except OSError:  # Only the eviction order is lost
+                    pass
+
+    def _save_index(self) -> None:
+        _write_atomic(self._index_path, json.dumps(self._entries).encode())
+        self._saved_at = time.monotonic()
+        self._dirty = False
+
+
+class SzsCache:
+    """
+    Decompressed SARC payloads of .szs files, kept on disk between sessions.
+
+    A file is first looked up by its identity (resolved path, size and mtime),
+    which needs only a stat. When that misses, the file is read and looked up by
+    the hash of its content, so a copy of an archive that is already cached is
+    not decompressed again. Patched archives resolve to a different path than
+    their RomFS originals and therefore never share an identity with them.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024) -> None:
+        self.blobs = DiskCache(directory, max_bytes)
+        self._lock = threading.Lock()
+        self._identities_path = os.path.join(directory, "identities.json")
+        self._identities: Dict[str, str] = {}
+        try:
+            with open(self._identities_path, "r") as f:
+                self._identities = json.load(f)
+        except (OSError, ValueError):
+            self._identities = {}
+
+    @staticmethod
+    def _identity(path: str) -> str:
+        stat = os.stat(path)
+        resolved = os.path.normcase(os.path.realpath(path))
+        return f"{resolved}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def load(self, path: str, decompress: Callable[[bytes], bytes]) -> bytes:
+        identity = self._identity(path)
+        key = self._identities.get(identity)
+        if key is not None:
+            data = self.blobs.get(key)
+            if data is not None:
+                return data
+
+        with open(path, "rb") as f:
+            raw = f.read()
+        key = hashlib.sha256(raw).hexdigest()
+        data = self.blobs.get(key)
+        if data is None:
+            data = decompress(raw)
+            self.blobs.put(key, data)
+        self._remember(identity, key)
+        return data
+
+    def add(self, path: str, raw: bytes, data: bytes) -> None:
+        """Record a file the tool just wrote, so reopening it is a cache hit."""
+        key = hashlib.sha256(raw).hexdigest()
+        self.blobs.put(key, data)
+        self._remember(self._identity(path), key)
+
+    def _remember(self, identity: str, key: str) -> None:
+        with self._lock:
+            # Older identities of the same path are stale once its size or
+            # mtime changes.
+            prefix = identity.rsplit("|", 2)[0] + "|"
+            for old in [i for i in self._identities if i.startswith(prefix)]:
+                del self._identities[old]
+            self._identities[identity] = key
+            for old in [i for i, k in self._identities.items() if k not in self.blobs]:
+                del self._identities[old]
+            _write_atomic(self._identities_path, json.dumps(self._identities).encode())
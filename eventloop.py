@@ -0,0 +1,52 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Coroutine
+
+
+class EventLoopThread:
+    """
+    An asyncio loop running on its own thread, next to the GUI.
+
+    Coroutines are handed to it from any thread with submit() and run at the
+    loop's own pace, not the frame rate. Work that has to happen on the GUI
+    thread (drawing, dialogs, state the frames read) is queued with
+    in_frame() and run by run_frame_callbacks(), which the GUI calls once per
+    frame.
+    """
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self._callbacks: "queue.SimpleQueue[tuple]" = queue.SimpleQueue()
+        self._thread = threading.Thread(
+            target=self._run, name="event loop", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine: Coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def in_frame(self, callback: Callable, *args: Any) -> None:
+        """Run callback(*args) on the GUI thread at the start of the next frame."""
+        self._callbacks.put((callback, args))
+
+    def then_in_frame(self, future: Future, callback: Callable[[Future], Any]) -> None:
+        """Run callback(future) in the first frame after future is done."""
+        future.add_done_callback(lambda done: self.in_frame(callback, done))
+
+    def run_frame_callbacks(self) -> None:
+        while True:
+            try:
+                callback, args = self._callbacks.get_nowait()
+            except queue.Empty:
+                return
+            callback(*args)
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+ROMFS_FOLDERS = (
+    "EffectData",
+    "EventData",
+    "LayoutData",
+    "LocalizedData",
+    "MovieData",
+    "ObjectData",
+    "ShaderData",
+    "SoundData",
+    "StageData",
+    "SystemData",
+)
+
+
+def validate(romfs_path: Optional[str], patches_path: Optional[str]) -> Optional[str]:
+    """Return why the folders can't be used, or None if they are fine."""
+    if not romfs_path:
+        return "A RomFS folder must be selected."
+    if not os.path.isdir(romfs_path):
+        return "RomFS path does not exist!"
+    if not all(os.path.isdir(os.path.join(romfs_path, i)) for i in ROMFS_FOLDERS):
+        return "RomFS path is not a valid Super Mario Odyssey RomFS!"
+    if not os.path.isdir(patches_path or ""):
+        return "You must select a folder to save the patches to."
+    return None
+
+
+class FolderStatus:
+    """
+    The last validation result of the RomFS and patches folders.
+
+    The folders are only checked again when the selected paths change, when
+    invalidate() is called, or once every recheck_interval seconds to notice
+    folders that were removed or created behind the tool's back.
+    """
+
+    def __init__(self, recheck_interval: float = 5.0) -> None:
+        self.recheck_interval = recheck_interval
+        self._lock = threading.Lock()
+        self._paths: Optional[Tuple[Optional[str], Optional[str]]] = None
+        self._error: Optional[str] = None
+        self._checked_at = 0.0
+
+    def invalidate(self) -> None:
+        self._paths = None
+
+    def error(
+        self, romfs_path: Optional[str], patches_path: Optional[str]
+    ) -> Optional[str]:
+        paths = (romfs_path, patches_path)
+        now = time.monotonic()
+        if paths != self._paths or now - self._checked_at >= self.recheck_interval:
+            with self._lock:
+                self._error = validate(romfs_path, patches_path)
+                self._paths = paths
+                self._checked_at = now
+        return self._error
+
+
+def resolve_file(romfs_path: str, patches_path: str, path: str) -> str:
+    """The patched copy of a RomFS file if there is one, else the original."""
+    patched = os.path.join(patches_path, path)
+    if os.path.exists(patched):
+        return patched
+    return os.path.join(romfs_path, path)
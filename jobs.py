@@ -0,0 +1,131 @@
+import threading
+import traceback
+from concurrent.futures import Future, wait
+from typing import Callable, Dict, List, Literal, Optional
+
+from profiling import span
+
+Status = Literal["queued", "running", "done", "failed", "cancelled"]
+
+
+class Job:
+    def __init__(self, kind: str, target: str, function: Callable, args: tuple) -> None:
+        self.kind = kind
+        self.target = target
+        self.function = function
+        self.args = args
+        self.status: Status = "queued"
+        self.error: Optional[BaseException] = None
+        self.traceback: Optional[str] = None  # Of error, formatted
+        # Done when the job is, for callers that want to be told.
+        self.future: Future = Future()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        wait([self.future], timeout)
+        return self.future.done()
+
+
+class JobScheduler:
+    """
+    Runs background work (saves, conversions) on threads.
+
+    Every job has a kind and a target, usually the file it writes. Jobs of a
+    kind run at most limits[kind] at a time (default_limit for other kinds),
+    and jobs of one target never run at the same time. A job submitted while
+    another one for its target is still queued replaces it, so clicking Save
+    five times during a save runs at most one more save.
+    """
+
+    def __init__(self, limits: Dict[str, int], default_limit: int = 1) -> None:
+        self.limits = limits
+        self.default_limit = default_limit
+        self._lock = threading.Lock()
+        self._queue: List[Job] = []
+        self._running: List[Job] = []
+        self._latest: Dict[str, Job] = {}
+
+    def submit(self, kind: str, target: str, function: Callable, *args) -> Job:
+        job = Job(kind, target, function, args)
+        with self._lock:
+            for queued in [i for i in self._queue if i.target == target]:
+                self._queue.remove(queued)
+                self._finish(queued, "cancelled")
+            self._queue.append(job)
+            self._latest[target] = job
+            self._start_ready()
+        return job
+
+    def cancel(self, target: str) -> bool:
+        """Drop the queued job of target. Running jobs are left to finish."""
+        with self._lock:
+            for job in self._queue:
+                if job.target == target:
+                    self._queue.remove(job)
+                    self._finish(job, "cancelled")
+                    return True
+        return False
+
+    def cancel_all(self) -> int:
+        with self._lock:
+            jobs, self._queue = self._queue, []
+            for job in jobs:
+                self._finish(job, "cancelled")
+        return len(jobs)
+
+    def status(self, target: str) -> Optional[Job]:
+        """The last job submitted for target, if any."""
+        return self._latest.get(target)
+
+    def busy(self, target: str) -> bool:
+        job = self._latest.get(target)
+        return job is not None and job.active
+
+    def active(self) -> List[Job]:
+        with self._lock:
+            return self._running + self._queue
+
+    def _start_ready(self) -> None:
+        running_targets = {job.target for job in self._running}
+        for job in list(self._queue):
+            running = sum(1 for i in self._running if i.kind == job.kind)
+            if (
+                running >= self.limits.get(job.kind, self.default_limit)
+                or job.target in running_targets
+            ):
+                continue
+            self._queue.remove(job)
+            self._running.append(job)
+            running_targets.add(job.target)
+            job.status = "running"
+            threading.Thread(
+                target=self._run, args=(job,), name=f"{job.kind} job", daemon=True
+            ).start()
+
+    def _run(self, job: Job) -> None:
+        try:
+            with span(f"{job.kind} {job.target}", "job"):
+                job.function(*job.args)
+        except Exception as e:
+            job.error = e
+            job.traceback = traceback.format_exc()
+            status: Status = "failed"
+        else:
+            status = "done"
+        with self._lock:
+            self._running.remove(job)
+            self._finish(job, status)
+            self._start_ready()
+
+    @staticmethod
+    def _finish(job: Job, status: Status) -> None:
+        job.status = status
+        if status == "cancelled":
+            job.future.cancel()
+        elif job.error is not None:
+            job.future.set_exception(job.error)
+        else:
+            job.future.set_result(None)
@@ -1,155 +1,163 @@
+from profiling import profiler, span  # First, startup is timed from here
+
 import asyncio
 import json
+import multiprocessing
 import os
-import random
-import shutil
-import subprocess
-import sys
-import tempfile
-from tkinter import filedialog, messagebox, simpledialog
-from typing import Literal
-
-import byml
+from array import array
+from concurrent.futures import Future
+from functools import partial
+from typing import Optional
+
 import imgui
-import libyaz0
 import pygui  # py-gui-tool
-import SarcLib
 from appdirs import user_config_dir
 
-
-def resource_path(relative_path):
-    """Get absolute path to resource, works for dev and for PyInstaller"""
-    base_path = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
-    return os.path.join(base_path, relative_path)
-
+import views
+import yaz0
+from audio import AudioTools, ConversionCache
+from cache import SzsCache
+from eventloop import EventLoopThread
+from folders import FolderStatus
+from jobs import JobScheduler
+from memory_cache import MemoryCache, deep_size
+from preload import Load, Preloader
+from randomizer import randomize
+from resources import resource_path
+from romfs_index import RomfsIndex
+from sarc import SarcArchive
+from search import SearchIndex, TreeSearchIndex
+from szs import decode_szs, export_szs
+from vfs import OverlayFS
 
 window = pygui.Window(
     "Super Mario Odyssey Modding Tool", 800, 600, resource_path("Roboto-Regular.ttf")
 )
 
-loop = asyncio.get_event_loop_policy().get_event_loop()
+event_loop = EventLoopThread()
+
+folder_status = FolderStatus()
+overlay_fs = OverlayFS()
+scheduler = JobScheduler({"save": 2, "audio": 2})
+preloader = Preloader()
+# What the editors show, loaded again when they are opened after an eviction.
+editor_cache = MemoryCache(256 * 1024 * 1024)
+
+# Milliseconds from startup to the first frame with the archives in the cache.
+STARTUP_TARGET = 1000
+
+EDITOR_ARCHIVES = (
+    os.path.join("SystemData", "ItemList.szs"),
+    os.path.join("ObjectData", "PlayerActorHakoniwa.szs"),
+    os.path.join("SoundData", "BgmDataBase.szs"),
+)
 
 
 def folder_checker(elements: pygui.Elements):
-    selected = elements.state.get("romfs_path")
-    exists = os.path.isdir(elements.state.get("romfs_path", ""))
-    good_romfs = (
-        exists
-        and os.path.isdir(os.path.join(elements.state.get("romfs_path"), "EffectData"))
-        and os.path.isdir(os.path.join(elements.state.get("romfs_path"), "EventData"))
-        and os.path.isdir(os.path.join(elements.state.get("romfs_path"), "LayoutData"))
-        and os.path.isdir(
-            os.path.join(elements.state.get("romfs_path"), "LocalizedData")
-        )
-        and os.path.isdir(os.path.join(elements.state.get("romfs_path"), "MovieData"))
-        and os.path.isdir(os.path.join(elements.state.get("romfs_path"), "ObjectData"))
-        and os.path.isdir(os.path.join(elements.state.get("romfs_path"), "ShaderData"))
-        and os.path.isdir(os.path.join(elements.state.get("romfs_path"), "SoundData"))
-        and os.path.isdir(os.path.join(elements.state.get("romfs_path"), "StageData"))
-        and os.path.isdir(os.path.join(elements.state.get("romfs_path"), "SystemData"))
+    error = folder_status.error(
+        elements.state.get("romfs_path"), elements.state.get("patches_path")
     )
-    if not selected:
-        elements.text("A RomFS folder must be selected.")
-        return False
-    if not exists:
-        elements.text("RomFS path does not exist!")
-        return False
-    if not good_romfs:
-        elements.text("RomFS path is not a valid Super Mario Odyssey RomFS!")
-        return False
-    if not os.path.isdir(elements.state.get("patches_path", "")):
-        elements.text("You must select a folder to save the patches to.")
+    if error:
+        elements.text(error)
         return False
     return True
 
 
-def decode_szs(file: str) -> SarcLib.SARC_Archive:
-    with open(file, "rb") as f:
-        data = f.read()
-
-    while libyaz0.IsYazCompressed(data):
-        data = libyaz0.decompress(data)
+def overlay() -> OverlayFS:
+    overlay_fs.use(
+        window.state.get("romfs_path", ""), window.state.get("patches_path", "")
+    )
+    return overlay_fs
 
-    archive = SarcLib.SARC_Archive()
-    archive.load(data)
-    return archive
 
+def get_file(path: str):
+    return overlay().resolve(path)
 
-def export_szs(archive: SarcLib.SARC_Archive, path: str) -> None:
-    data = archive.save()[0]
-    data = libyaz0.compress(data)
-    if not os.path.exists(os.path.dirname(path)):
-        os.makedirs(os.path.dirname(path))
-    with open(path, "wb") as f:
-        f.write(data)
 
+def edit_shop_save(state: pygui.elements.State, editor: dict):
+    import byml
 
-def get_file(path: str):
-    patches_path = os.path.join(window.state.get("patches_path", ""), path)
-    romfs_path = os.path.join(window.state.get("romfs_path", ""), path)
-    if os.path.exists(patches_path):
-        return patches_path
-    return romfs_path
-
-
-def get_file_from_szs(szs: SarcLib.SARC_Archive, path: str):
-    for file in szs.contents:
-        if isinstance(file, SarcLib.FileArchive.File) and file.name == path:
-            return file
-    return None
-
-
-def edit_shop_save(state: pygui.elements.State):
-    shop_data_szs = state.get("shop_data_szs")
-    shop_data = state.get("shop_data")
-    be = state.get("shop_data_be")
-    for item in shop_data:
-        item["Price"] = byml.Int(state.get(item["ItemName"] + "Price", item["Price"]))
-    data = byml.Writer(shop_data, be, 3).get_bytes()
-    get_file_from_szs(shop_data_szs, "ItemList.byml").data = data
-    export_szs(
+    shop_data_szs = editor["shop_data_szs"]
+    shop_data = editor["shop_data"]
+    be = editor["shop_data_be"]
+    patcher = editor["shop_data_patcher"]
+    dirty = set(editor["shop_dirty"])
+    editor["shop_dirty"].difference_update(dirty)
+    changes = {}
+    for index, item in enumerate(shop_data):
+        if item["ItemName"] not in dirty:
+            continue
+        price = byml.Int(state.get(item["ItemName"] + "Price", item["Price"]))
+        if price != item["Price"]:
+            changes[(index, "Price")] = item["Price"] = price
+    if changes:
+        if not patcher.apply(changes):
+            patcher.load(byml.Writer(shop_data, be, 3).get_bytes())
+        shop_data_szs["ItemList.byml"] = patcher.get_bytes()
+    if shop_data_szs.modified and export_szs(
         shop_data_szs,
         os.path.join(state.get("patches_path"), "SystemData", "ItemList.szs"),
-    )
-    state["shop_editor_loading"] = False
-
-
-async def run_edit_shop_save(state: pygui.elements.State):
-    await loop.run_in_executor(None, edit_shop_save, state)
-
-
-def stat_editor_save(state: pygui.elements.State):
-    player_actor_szs = state.get("player_actor_szs")
-    player_const = state.get("player_const")
-    be = state.get("player_const_be")
-    for key, value in player_const.items():
-        player_const[key] = type(value)(state.get("PlayerConstValue" + key))
-    data = byml.Writer(player_const, be, 3).get_bytes()
-    get_file_from_szs(player_actor_szs, "PlayerConst.byml").data = data
-    export_szs(
+        state.get("compression_level", "balanced"),
+        szs_cache,
+    ):
+        overlay().add(os.path.join("SystemData", "ItemList.szs"))
+
+
+def stat_editor_save(state: pygui.elements.State, editor: dict):
+    import byml
+
+    player_actor_szs = editor["player_actor_szs"]
+    player_const = editor["player_const"]
+    be = editor["player_const_be"]
+    patcher = editor["player_const_patcher"]
+    dirty = set(editor["player_const_dirty"])
+    editor["player_const_dirty"].difference_update(dirty)
+    changes = {}
+    for key in dirty:
+        value = player_const[key]
+        new_value = type(value)(state.get("PlayerConstValue" + key, value))
+        if new_value != value:
+            changes[(key,)] = player_const[key] = new_value
+    if changes:
+        if not patcher.apply(changes):
+            patcher.load(byml.Writer(player_const, be, 3).get_bytes())
+        player_actor_szs["PlayerConst.byml"] = patcher.get_bytes()
+    if player_actor_szs.modified and export_szs(
         player_actor_szs,
         os.path.join(
             state.get("patches_path"), "ObjectData", "PlayerActorHakoniwa.szs"
         ),
-    )
-    state["player_stat_editor_loading"] = False
+        state.get("compression_level", "balanced"),
+        szs_cache,
+    ):
+        overlay().add(os.path.join("ObjectData", "PlayerActorHakoniwa.szs"))
+
+
+def report_failure(action: str, future: Future):
+    from tkinter import messagebox
+
+    if not future.cancelled() and future.exception() is not None:
+        messagebox.showerror("Error", f"Could not {action}: {future.exception()}")
+
 
+def import_track(source: str, destination: str, number_of_loops: Optional[int]):
+    if number_of_loops is None:
+        AudioTools(source).save_looping_bfstm(destination)
+    else:
+        AudioTools(source).save_bfstm(destination, number_of_loops)
+    overlay().add(destination)
 
-async def run_stat_editor_save(state: pygui.elements.State):
-    await loop.run_in_executor(None, stat_editor_save, state)
 
+def export_song(target: str, music_info):
+    from tkinter import filedialog, messagebox
 
-def export_song(state: pygui.elements.State, data, music_info, scenario):
     resource_name = music_info["ResourceName"]
-    file_path = get_file(os.path.join("SoundData", "stream", resource_name + ".bfstm"))
-    if not os.path.exists(file_path):
+    stream_file = os.path.join("SoundData", "stream", resource_name + ".bfstm")
+    file_path = get_file(stream_file)
+    if not overlay().exists(stream_file):
         messagebox.showerror("Error", "File not found: " + os.path.normpath(file_path))
-        state[
-            f"music_editor_export_{data['Name']}_{scenario['ScenarioNo']}_{music_info['Name']}_loading"
-        ] = False
         return
-    save_to = filedialog.asksaveasfile(
-        "wb",
+    save_to = filedialog.asksaveasfilename(
         confirmoverwrite=True,
         defaultextension=".wav",
         title="Export sound to a file (by default wav)",
@@ -163,31 +171,28 @@ def export_song(state: pygui.elements.State, data, music_info, scenario):
     )
 
     if save_to:
-        extension = save_to.name.split(".")[-1]
-        audio = AudioTools(file_path)
-        output = audio.convert("bfstm")
-        if extension == "mp3":
-            with open(AudioTools.convert_to_mp3(output), "rb") as f:
-                save_to.write(f.read())
-        elif extension == "ogg":
-            with open(AudioTools.convert_to_ogg(output), "rb") as f:
-                save_to.write(f.read())
-        else:
-            with open(output, "rb") as f:
-                save_to.write(f.read())
-    state[
-        f"music_editor_export_{data['Name']}_{scenario['ScenarioNo']}_{music_info['Name']}_loading"
-    ] = False
-
+        extension = save_to.split(".")[-1]
+        job = scheduler.submit(
+            "audio",
+            target,
+            AudioTools(file_path).save_audio,
+            save_to,
+            extension if extension in ("mp3", "ogg") else "wav",
+        )
+        event_loop.then_in_frame(
+            job.future, partial(report_failure, f"export {resource_name}")
+        )
 
-async def run_export_song(state: pygui.elements.State, data, music_info, scenario):
-    await loop.run_in_executor(None, export_song, state, data, music_info, scenario)
 
+def import_song(target: str, music_info):
+    from tkinter import filedialog, messagebox, simpledialog
 
-def import_song(state: pygui.elements.State, data, music_info, scenario):
     resource_name = music_info["ResourceName"]
     file_path_to_replace = os.path.join(
-        state.get("patches_path"), "SoundData", "stream", resource_name + ".bfstm"
+        window.state.get("patches_path"),
+        "SoundData",
+        "stream",
+        resource_name + ".bfstm",
     )
     file_to_use = filedialog.askopenfilename(
         defaultextension=".wav",
@@ -202,404 +207,710 @@ def import_song(state: pygui.elements.State, data, music_info, scenario):
     )
 
     if file_to_use:
-        extension = file_to_use.split(".")[-1]
-        if extension == "mp3":
-            file_to_use = AudioTools.convert_mp3_to_wav(file_to_use)
-        elif extension == "ogg":
-            file_to_use = AudioTools.convert_ogg_to_wav(file_to_use)
-        audio = AudioTools(file_to_use)
-        output = audio.convert(
-            "wav",
-            simpledialog.askinteger(
-                "Number Of Loops",
-                "How many times should the song be looped? By default 1",
-            )
-            or 1,
+        loop_in_game = messagebox.askyesnocancel(
+            "Loop",
+            "Loop the song in game? Yes stores it once with its loop points (a WAV's "
+            "smpl chunk, or the whole song). No repeats it a number of times.",
         )
-        if not os.path.exists(os.path.dirname(file_path_to_replace)):
-            os.makedirs(os.path.dirname(file_path_to_replace))
-        with open(file_path_to_replace, "wb") as f:
-            with open(output, "rb") as f2:
-                f.write(f2.read())
-    state[
-        f"music_editor_import_{data['Name']}_{scenario['ScenarioNo']}_{music_info['Name']}_loading"
-    ] = False
-
-
-async def run_import_song(state: pygui.elements.State, data, music_info, scenario):
-    await loop.run_in_executor(None, import_song, state, data, music_info, scenario)
-
-
-class AudioTools:
-    vgmstream = resource_path(os.path.join("audio_tools", "vgmstream.exe"))
-    vgaudio = resource_path(os.path.join("audio_tools", "vgaudio.exe"))
-    ffmpeg = resource_path(os.path.join("audio_tools", "ffmpeg.exe"))
-    oggenc = resource_path(os.path.join("audio_tools", "oggenc.exe"))
-
-    def __init__(self, input_file: str) -> None:
-        self.input_file = input_file
-
-    def convert(
-        self, ext: Literal["bfstm", "wav", "mp3", "ogg"], number_of_loops: int = 1
-    ) -> str:
-        if ext == "bfstm":
-            return self._convert_bfstm(number_of_loops)
-        elif ext == "wav":
-            return self._convert_wav(number_of_loops)
-        elif ext == "mp3":
-            old_input_file = self.input_file
-            self.input_file = self.convert_mp3_to_wav(self.input_file)
-            result = self._convert_wav(number_of_loops)
-            self.input_file = old_input_file
-            return result
-        elif ext == "ogg":
-            old_input_file = self.input_file
-            self.input_file = self.convert_ogg_to_wav(self.input_file)
-            result = self._convert_wav(number_of_loops)
-            self.input_file = old_input_file
-        else:
-            raise ValueError(f"Unknown file format: {ext}")
-
-    def _convert_bfstm(self, _: bool = True) -> str:
-        output_file = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-        output_file.close()
-        subprocess.call(
-            [
-                self.vgmstream,
-                "-o",
-                output_file.name,
-                str(self.input_file),
-            ],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
+        if loop_in_game is None:
+            return
+        number_of_loops = None
+        if not loop_in_game:
+            number_of_loops = (
+                simpledialog.askinteger(
+                    "Number Of Loops",
+                    "How many times should the song be looped? By default 1",
+                )
+                or 1
+            )
+        job = scheduler.submit(
+            "audio",
+            target,
+            import_track,
+            file_to_use,
+            file_path_to_replace,
+            number_of_loops,
         )
-        return output_file.name
-
-    def _convert_wav(self, number_of_loops: int = 1) -> str:
-        input_file = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-        input_file.close()
-        subprocess.call(
-            [
-                self.ffmpeg,
-                "-i",
-                str(self.input_file),
-                "-af",
-                "asetrate=32000",
-                str(input_file.name),
-                "-y",
-            ],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
+        event_loop.then_in_frame(
+            job.future, partial(report_failure, f"import {resource_name}")
         )
 
-        lwav_file = tempfile.NamedTemporaryFile(suffix=".lwav", delete=False)
-        lwav_file.close()
-        subprocess.call(
-            [
-                self.vgmstream,
-                "-f",
-                "0",
-                f"-l {number_of_loops}",
-                "-L",
-                "-o",
-                lwav_file.name,
-                str(input_file.name),
-            ],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
 
-        output_file = tempfile.NamedTemporaryFile(suffix=".bfstm", delete=False)
-        output_file.close()
-        subprocess.call(
-            [
-                self.vgaudio,
-                "--little-endian",
-                lwav_file.name,
-                output_file.name,
-            ],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        return output_file.name
-
-    @staticmethod
-    def convert_to_mp3(file: str) -> str:
-        temp = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
-        temp.close()
-        subprocess.call(
-            [AudioTools.ffmpeg, "-i", file, temp.name, "-y"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        return temp.name
-
-    @staticmethod
-    def convert_to_ogg(file: str) -> str:
-        temp = tempfile.NamedTemporaryFile(suffix=".ogg", delete=False)
-        temp.close()
-        subprocess.call(
-            [AudioTools.oggenc, "-o", temp.name, file, "-Q"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        return temp.name
-
-    @staticmethod
-    def convert_mp3_to_wav(file: str) -> str:
-        temp = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-        temp.close()
-        subprocess.call(
-            [AudioTools.ffmpeg, "-i", file, temp.name, "-y"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        return temp.name
-
-    @staticmethod
-    def convert_ogg_to_wav(file: str) -> str:
-        temp = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-        temp.close()
-        subprocess.call(
-            [AudioTools.oggenc, "-o", temp.name, file, "-Q"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        return temp.name
+def change_folder(key: str, path: str) -> None:
+    """Use another RomFS or patches folder, dropping what came from the old one."""
+    from tkinter import messagebox
+
+    if not path or path == window.state.get(key):
+        return
+    if any(job.kind == "save" for job in scheduler.active()):
+        messagebox.showerror("Error", "Wait for the running saves to finish first")
+        return
+    # The editors show the old folders, saving them would mix the two.
+    if editor_cache.pinned() and not messagebox.askyesno(
+        "Unsaved Edits", "Discard the unsaved edits in the open editors?"
+    ):
+        return
+    window.state[key] = path
+    folder_status.invalidate()
+    preloader.clear()
+    editor_cache.clear()
 
 
 @window.menu("File", "Select RomFS Folder", ["Ctrl", "R"])
 def select_romfs_folder():
-    window.state["romfs_path"] = filedialog.askdirectory(
-        initialdir=window.state.get("romfs_path"), mustexist=True, title="RomFS Folder"
-    ) or window.state.get("romfs_path", "")
+    from tkinter import filedialog
+
+    change_folder(
+        "romfs_path",
+        filedialog.askdirectory(
+            initialdir=window.state.get("romfs_path"),
+            mustexist=True,
+            title="RomFS Folder",
+        ),
+    )
 
 
 @window.menu("File", "Select Patches Folder", ["Ctrl", "P"])
 def select_patches_folder():
-    window.state["patches_path"] = filedialog.askdirectory(
-        mustexist=True, title="Patches Folder"
-    ) or window.state.get("patches_path", "")
+    from tkinter import filedialog
+
+    change_folder(
+        "patches_path",
+        filedialog.askdirectory(mustexist=True, title="Patches Folder"),
+    )
+
+
+def set_compression_level(level: yaz0.Level):
+    from tkinter import messagebox
+
+    window.state["compression_level"] = level
+    messagebox.showinfo("Compression", f"Archives will be saved with {level} level")
+
+
+@window.menu("Compression", "Store (no compression)")
+def compression_store():
+    set_compression_level("store")
+
+
+@window.menu("Compression", "Fast")
+def compression_fast():
+    set_compression_level("fast")
+
+
+@window.menu("Compression", "Balanced")
+def compression_balanced():
+    set_compression_level("balanced")
+
+
+@window.menu("Compression", "Max")
+def compression_max():
+    set_compression_level("max")
+
 
 @window.menu("Randomize", "Randomize Music")
 def randomize_music():
+    from tkinter import messagebox, simpledialog
+
     if not window.state.get("romfs_path"):
         return messagebox.showerror("Error", "No RomFS folder selected")
     if not window.state.get("patches_path"):
         return messagebox.showerror("Error", "No Patches folder selected")
-    files = os.listdir(os.path.join(window.state["romfs_path"], "SoundData", "stream"))
-    random_files = random.sample(files, len(files))
-    
-    if not os.path.exists(os.path.join(window.state["patches_path"], "SoundData", "stream")):
-        os.makedirs(os.path.join(window.state["patches_path"], "SoundData", "stream"))
-    
-    for old, new in zip(files, random_files):
-        shutil.copyfile(os.path.join(window.state["romfs_path"], "SoundData", "stream", old), os.path.join(window.state["patches_path"], "SoundData", "stream", new))
+    seed = simpledialog.askstring(
+        "Seed", "Seed to reproduce an earlier shuffle (leave empty for a new one)"
+    )
+    if seed is None:
+        return
+    if seed and not seed.isdigit():
+        return messagebox.showerror("Error", "The seed must be a number")
+
+    future = event_loop.submit(
+        randomize_stream(
+            window.state["romfs_path"],
+            window.state["patches_path"],
+            int(seed) if seed else None,
+        )
+    )
+    event_loop.then_in_frame(future, randomized_music)
+
+
+async def randomize_stream(romfs_path: str, patches_path: str, seed: Optional[int]):
+    stream = os.path.join("SoundData", "stream")
+    result = await asyncio.get_running_loop().run_in_executor(
+        None,
+        randomize,
+        romfs_path,
+        patches_path,
+        stream,
+        seed,
+    )
+    overlay().refresh(stream)
+    return result
+
+
+def randomized_music(future: Future):
+    from tkinter import messagebox
+
+    if future.cancelled() or future.exception() is not None:
+        return report_failure("randomize the music", future)
+    messagebox.showinfo("Success", f"Randomized music with seed {future.result().seed}")
+
+
+@window.menu("Jobs", "Cancel Queued Jobs")
+def cancel_queued_jobs():
+    from tkinter import messagebox
+
+    cancelled = scheduler.cancel_all()
+    messagebox.showinfo("Jobs", f"Cancelled {cancelled} queued jobs")
+
+
+def job_label(target: str, label: str) -> str:
+    """The label of a button that starts a job, showing how far the job is."""
+    job = scheduler.status(target)
+    if job is not None and job.status == "queued":
+        return "Queued..."
+    if job is not None and job.status == "running":
+        return "Loading..."
+    return label
+
+
+def job_error(target: str):
+    job = scheduler.status(target)
+    if job is not None and job.status == "failed":
+        imgui.same_line()
+        imgui.text_disabled(f"Failed: {job.error}")
+        if imgui.is_item_hovered():
+            imgui.set_tooltip(job.traceback)
+
+
+@window.menu("Profiler", "Toggle Overlay")
+def toggle_profiler_overlay():
+    window.state["profiler_overlay"] = not window.state.get("profiler_overlay")
+
+
+@window.menu("Profiler", "Export Trace")
+def export_trace():
+    from tkinter import filedialog, messagebox
+
+    path = filedialog.asksaveasfilename(
+        confirmoverwrite=True,
+        defaultextension=".json",
+        title="Export a Chrome trace",
+        filetypes=((".json", "Chrome Trace"),),
+        initialfile="trace.json",
+    )
+    if path:
+        profiler.export(path)
+        messagebox.showinfo("Profiler", f"Trace saved to {path}")
+
+
+def start_frame():
+    # pygui has no hook for every frame, the frames call this instead.
+    if not profiler.frame(imgui.get_time()):
+        return
+    event_loop.run_frame_callbacks()
+    editor_cache.trim()
+    if not window.state.get("profiler_overlay"):
+        return
+    imgui.set_next_window_size(420, 300, imgui.FIRST_USE_EVER)
+    imgui.begin("Profiler")
+    p50, p90, p99, worst = profiler.percentiles(50, 90, 99, 100)
+    imgui.text(f"Frame p50 {p50:.1f} ms  p90 {p90:.1f} ms")
+    imgui.text(f"Frame p99 {p99:.1f} ms  max {worst:.1f} ms")
+    startup = f"Startup {profiler.startup:.0f} ms (target {STARTUP_TARGET} ms)"
+    if profiler.startup > STARTUP_TARGET:
+        imgui.text_colored(startup + ", too slow", 1, 0.6, 0.2)
+    else:
+        imgui.text(startup)
+    if profiler.frame_times:
+        frame_times = array("f", profiler.frame_times)
+        imgui.plot_lines("##frame_times", frame_times, graph_size=(0, 80))
+    imgui.separator()
+    jobs = scheduler.active()
+    imgui.text(f"{len(jobs)} jobs")
+    for job in jobs:
+        imgui.text_disabled(f"{job.status} {job.kind}: {job.target}")
+    imgui.separator()
+    megabyte = 1024 * 1024
+    imgui.text(
+        f"Editor cache {editor_cache.bytes / megabyte:.1f} of "
+        f"{editor_cache.max_bytes / megabyte:.0f} MB, {len(editor_cache)} loaded"
+    )
+    imgui.text_disabled(
+        f"{editor_cache.hits} hits, {editor_cache.misses} misses, "
+        f"{editor_cache.evictions} evicted"
+    )
+    imgui.end()
+
+
+def editor_frame(title: str, elements: pygui.Elements, editor):
+    start_frame()
+    if imgui.is_window_collapsed():
+        return  # Unused, so its data can be evicted
+    with span(title, "frame"):
+        if folder_checker(elements):
+            editor(elements)
 
-    messagebox.showinfo("Success", "Randomized music")
 
 @window.frame("Shop Editor", 735, 480, (50, 100))
 def shop_editor_frame(elements: pygui.Elements):
-    if folder_checker(elements):
-        loop.run_until_complete(shop_editor(elements))
+    editor_frame("Shop Editor", elements, shop_editor)
 
 
 @window.frame("Player Stat Editor", 735, 480, (10, 70))
 def player_stat_editor_frame(elements: pygui.Elements):
-    if folder_checker(elements):
-        loop.run_until_complete(player_stat_editor(elements))
+    editor_frame("Player Stat Editor", elements, player_stat_editor)
 
 
 @window.frame("Music Editor", 735, 480, (20, 80))
 def music_editor_frame(elements: pygui.Elements):
-    if folder_checker(elements):
-        loop.run_until_complete(music_editor(elements))
-
-
-async def shop_editor(elements: pygui.Elements):
-    shop_data_szs = elements.state.get("shop_data_szs")
-    if not shop_data_szs:
-        elements.state["shop_data_szs"] = shop_data_szs = decode_szs(
-            get_file(os.path.join("SystemData", "ItemList.szs"))
-        )
-    shop_data = elements.state.get("shop_data")
-    if not shop_data:
-        data = byml.Byml(get_file_from_szs(shop_data_szs, "ItemList.byml").data)
-        elements.state["shop_data_be"] = data._be
-        elements.state["shop_data"] = shop_data = data.parse()
-    elements.text("Shop Editor", font_size=76)
+    editor_frame("Music Editor", elements, music_editor)
+
+
+@window.frame("RomFS Search", 735, 480, (30, 90))
+def romfs_search_frame(elements: pygui.Elements):
+    editor_frame("RomFS Search", elements, romfs_search)
+
+
+def clipped_rows(count: int, row_height: float):
+    """Yield the indices of the rows that are on screen, skipping the others.
+
+    Every row is placed at a fixed height so the scrollbar still covers all of
+    them, and only the visible ones have to be drawn.
+    """
+    start_y = imgui.get_cursor_pos_y()
+    scroll_y = imgui.get_scroll_y()
+    first = int((scroll_y - start_y) // row_height)
+    last = int((scroll_y + imgui.get_window_height() - start_y) // row_height) + 1
+    for index in range(max(first, 0), min(last, count)):
+        imgui.set_cursor_pos_y(start_y + index * row_height)
+        yield index
+    imgui.set_cursor_pos_y(start_y + count * row_height)
+    imgui.dummy(0, 0)
+
+
+def track_edit(dirty: set, key: str, value, original) -> None:
+    """Keep the set of edited fields of an editor up to date."""
+    if type(original)(value) != original:
+        dirty.add(key)
+    else:
+        dirty.discard(key)
+
+
+def decode_archive(load: Load, path: str) -> SarcArchive:
+    load.report(0.1, f"Looking for {os.path.basename(path)}...")
+    file = get_file(path)
+    load.report(0.3, f"Decoding {os.path.basename(path)}...")
+    return decode_szs(file, szs_cache)
+
+
+def loaded(elements: pygui.Elements, key: str, function, *args):
+    """
+    The result of a background load, or None after drawing how far it got in
+    its place.
+    """
+    load = preloader.load(key, function, *args)
+    if not load.done:
+        imgui.progress_bar(load.progress, (-1, 0), load.status)
+        return None
+    if load.error is not None:
+        elements.text(f"Could not load {key}: {load.error}")
+
+        @elements.button("Retry", key=f"retry_{key}")
+        def retry_button():
+            # The error may come from files changed behind the tool's back.
+            overlay().reload()
+            preloader.forget(key)
+
+        return None
+    return load.result()
+
+
+def parse_editor(load: Load, parse, archive: SarcArchive) -> tuple:
+    editor = parse(load, archive)
+    load.report(0.9, "Measuring...")
+    return editor, deep_size(editor)
+
+
+def has_unsaved_edits(editor: dict, archive_path: str) -> bool:
+    """Edited fields not saved yet, or a save that is still running."""
+    return scheduler.busy(archive_path) or any(
+        value.modified if isinstance(value, SarcArchive) else bool(value)
+        for value in editor.values()
+        if isinstance(value, (SarcArchive, set))
+    )
 
-    imgui.columns(3, "shopeditor")
-    imgui.separator()
 
-    elements.text("Name")
-    imgui.next_column()
+def load_editor(
+    elements: pygui.Elements, key: str, archive_path: str, parse
+) -> Optional[dict]:
+    """
+    What an editor shows. When it is not in editor_cache, its archive is
+    decoded and parsed in the background and None returned until then.
+    """
+    editor = editor_cache.get(key)
+    if editor is not None:
+        return editor
+    archive = loaded(elements, archive_path, decode_archive, archive_path)
+    if archive is None:
+        return None
+    parsed = loaded(elements, key, parse_editor, parse, archive)
+    if parsed is None:
+        return None
+    # The cache owns the archive and the parsed data from here.
+    preloader.forget(key)
+    preloader.forget(archive_path)
+    editor, size = parsed
+    return editor_cache.put(
+        key, editor, size, partial(has_unsaved_edits, editor, archive_path)
+    )
 
-    elements.text("Price")
-    imgui.next_column()
 
-    elements.text("Store")
-    imgui.next_column()
+def parse_shop(load: Load, shop_data_szs: SarcArchive) -> dict:
+    import byml
+    from byml_patch import BymlPatcher
+
+    load.report(0.0, "Parsing ItemList.byml...")
+    raw = bytes(shop_data_szs["ItemList.byml"])
+    with span("byml parse", file="ItemList.byml"):
+        data = byml.Byml(raw)
+        shop_data = data.parse()
+        patcher = BymlPatcher(raw)
+    return {
+        "shop_data_szs": shop_data_szs,
+        "shop_data": shop_data,
+        "shop_data_be": data._be,
+        "shop_data_patcher": patcher,
+        "shop_rows": views.shop_rows(shop_data),
+        "shop_dirty": set(),
+    }
+
+
+def shop_editor(elements: pygui.Elements):
+    editor = load_editor(
+        elements, "shop editor", os.path.join("SystemData", "ItemList.szs"), parse_shop
+    )
+    if editor is None:
+        return
+    shop_rows = editor["shop_rows"]
+    elements.text("Shop Editor", font_size=76)
 
+    column_width = imgui.get_window_width() / 3
+    imgui.separator()
+    elements.text("Name", wrap_text=False)
+    imgui.same_line(column_width)
+    elements.text("Price", wrap_text=False)
+    imgui.same_line(column_width * 2)
+    elements.text("Store", wrap_text=False)
     imgui.separator()
 
-    for item in list({v["ItemName"]: v for v in shop_data}.values()):
-        imgui.text(item["ItemName"])
-        imgui.next_column()
-        elements.input_int(
-            "", int(item["Price"]), key=item["ItemName"] + "Price", maximum=9999
+    imgui.push_item_width(column_width - imgui.get_style().item_spacing.x * 2)
+    for index in clipped_rows(len(shop_rows), imgui.get_frame_height_with_spacing()):
+        row = shop_rows[index]
+        imgui.text(row.name)
+        imgui.same_line(column_width)
+        price = elements.input_int(
+            "", int(row.item["Price"]), key=row.name + "Price", maximum=9999
         )
-        imgui.next_column()
-        imgui.text(item.get("StoreName", "All"))
-        imgui.next_column()
+        track_edit(editor["shop_dirty"], row.name, price, row.item["Price"])
+        imgui.same_line(column_width * 2)
+        imgui.text(row.store)
+    imgui.pop_item_width()
 
-    imgui.columns(1)
+    target = os.path.join("SystemData", "ItemList.szs")
 
-    @elements.button(
-        "Loading..." if elements.state.get("shop_editor_loading") else "Save"
-    )
+    @elements.button(job_label(target, "Save"))
     def shop_save_button():
-        elements.state["shop_editor_loading"] = True
-        loop.create_task(run_edit_shop_save(elements.state))
-
-
-async def player_stat_editor(elements: pygui.Elements):
-    player_actor_szs = elements.state.get("player_actor_szs")
-    if not player_actor_szs:
-        elements.state["player_actor_szs"] = player_actor_szs = decode_szs(
-            get_file(os.path.join("ObjectData", "PlayerActorHakoniwa.szs"))
-        )
-    player_const = elements.state.get("player_const")
-    if not player_const:
-        found_file = get_file_from_szs(player_actor_szs, "PlayerConst.byml")
-        if not found_file:
-            player_actor_szs.addFile(
-                SarcLib.File(
-                    "PlayerConst.byml",
-                    open(resource_path("PlayerConst.byml"), "rb").read(),
-                )
-            )
-            found_file = get_file_from_szs(player_actor_szs, "PlayerConst.byml")
-        byml_data = byml.Byml(found_file.data)
-        elements.state["player_const"] = player_const = byml_data.parse()
-        elements.state["player_const_be"] = byml_data._be
+        scheduler.submit("save", target, edit_shop_save, elements.state, editor)
+
+    job_error(target)
+
+
+def parse_player_const(load: Load, player_actor_szs: SarcArchive) -> dict:
+    import byml
+    from byml_patch import BymlPatcher
+
+    load.report(0.0, "Parsing PlayerConst.byml...")
+    if "PlayerConst.byml" not in player_actor_szs:
+        with open(resource_path("PlayerConst.byml"), "rb") as f:
+            player_actor_szs["PlayerConst.byml"] = f.read()
+    raw = bytes(player_actor_szs["PlayerConst.byml"])
+    with span("byml parse", file="PlayerConst.byml"):
+        byml_data = byml.Byml(raw)
+        player_const = byml_data.parse()
+        patcher = BymlPatcher(raw)
+    load.report(0.7, "Indexing stats...")
+    rows = views.stat_rows(player_const)
+    return {
+        "player_actor_szs": player_actor_szs,
+        "player_const": player_const,
+        "player_const_be": byml_data._be,
+        "player_const_patcher": patcher,
+        "player_const_rows": rows,
+        "player_const_dirty": set(),
+        "player_const_index": SearchIndex([row.search_text for row in rows]),
+    }
+
+
+def player_stat_editor(elements: pygui.Elements):
+    editor = load_editor(
+        elements,
+        "player stat editor",
+        os.path.join("ObjectData", "PlayerActorHakoniwa.szs"),
+        parse_player_const,
+    )
+    if editor is None:
+        return
+    player_const = editor["player_const"]
     elements.text("Player Stat Editor", font_size=76)
 
     searched = elements.input_text("Search...", "", key="player_const_search")
+    found = editor["player_const_index"].search(searched)
+    rows = editor["player_const_rows"]
 
     imgui.new_line()
 
-    for key, value in player_const.items():
-        if searched.lower() not in key.lower():
-            continue
-        if isinstance(value, (byml.Float, byml.Double)):
-            elements.input_float(key, float(value), key="PlayerConstValue" + key)
-        elif isinstance(value, (byml.Int, byml.Int64)):
-            elements.input_int(
-                key, int(value), key="PlayerConstValue" + key, wrap_text=False
+    for index in clipped_rows(len(found), imgui.get_frame_height_with_spacing()):
+        row = rows[found[index]]
+        value = player_const[row.key]
+        if row.is_float:
+            new_value = elements.input_float(
+                row.key, float(value), key="PlayerConstValue" + row.key
             )
+        else:
+            new_value = elements.input_int(
+                row.key, int(value), key="PlayerConstValue" + row.key, wrap_text=False
+            )
+        track_edit(editor["player_const_dirty"], row.key, new_value, value)
+
+    target = os.path.join("ObjectData", "PlayerActorHakoniwa.szs")
+
+    @elements.button(job_label(target, "Save"))
+    def player_stat_editor_save_button():
+        scheduler.submit("save", target, stat_editor_save, elements.state, editor)
+
+    job_error(target)
+
+
+def music_editor_row(elements: pygui.Elements, row: views.MusicRow):
+    if row.music_info is None:
+        imgui.bullet_text(row.label)
+        return
+    music_info = row.music_info
+    imgui.bullet_text(row.label)
+    stream_file = os.path.join(
+        "SoundData", "stream", music_info["ResourceName"] + ".bfstm"
+    )
+    if overlay().is_overridden(stream_file):
+        imgui.same_line()
+        imgui.text_disabled("(modified)")
+
+    imgui.same_line()
 
+    export_target = f"music_editor_export_{row.id}"
+
+    @elements.button(job_label(export_target, "Export"), key=export_target)
+    def export_button():
+        export_song(export_target, music_info)
+
+    imgui.same_line()
+
+    # Rows that use the same track write the same file.
     @elements.button(
-        "Loading..." if elements.state.get("player_stat_editor_loading") else "Save"
+        job_label(stream_file, "Import"), key=f"music_editor_import_{row.id}"
     )
-    def player_stat_editor_save_button():
-        elements.state["player_stat_editor_loading"] = True
-        loop.create_task(run_stat_editor_save(elements.state))
+    def import_button():
+        import_song(stream_file, music_info)
+
+    imgui.same_line()
+
+    @elements.button("Waveform", key=f"music_editor_waveform_{row.id}")
+    def waveform_button():
+        elements.state["music_preview"] = stream_file
+
+
+def parse_music(load: Load, bgm_data_base_szs: SarcArchive) -> dict:
+    import byml
+
+    load.report(0.0, "Parsing BgmStageInfoList.byml...")
+    with span("byml parse", file="BgmStageInfoList.byml"):
+        byml_data = byml.Byml(bytes(bgm_data_base_szs["BgmStageInfoList.byml"]))
+        bgm_stage_info_list = byml_data.parse()
+    load.report(0.7, "Indexing tracks...")
+    rows = views.music_rows(bgm_stage_info_list)
+    return {
+        "bgm_data_base_szs": bgm_data_base_szs,
+        "bgm_stage_info_list": bgm_stage_info_list,
+        "bgm_stage_info_list_be": byml_data._be,
+        "music_rows": rows,
+        "music_index": TreeSearchIndex(
+            [row.search_text for row in rows], [row.depth for row in rows]
+        ),
+    }
 
 
-async def music_editor(elements: pygui.Elements):
-    bgm_data_base_szs = elements.state.get("bgm_data_base_szs")
-    if not bgm_data_base_szs:
-        elements.state["bgm_data_base_szs"] = bgm_data_base_szs = decode_szs(
-            get_file(os.path.join("SoundData", "BgmDataBase.szs"))
-        )
-    bgm_stage_info_list = elements.state.get("bgm_stage_info_list")
-    if not bgm_stage_info_list:
-        byml_data = byml.Byml(
-            get_file_from_szs(bgm_data_base_szs, "BgmStageInfoList.byml").data
-        )
-        elements.state["bgm_stage_info_list"] = bgm_stage_info_list = byml_data.parse()
-        elements.state["bgm_stage_info_list_be"] = byml_data._be
+def load_preview(load: Load, stream_file: str) -> tuple:
+    from bfstm import Bfstm, waveform
+
+    name = os.path.basename(stream_file)
+    load.report(0.0, f"Reading {name}...")
+    stream = Bfstm.open(get_file(stream_file))
+    peaks = waveform(stream, 512, lambda done: load.report(done, f"Decoding {name}..."))
+    return stream.info, array("f", peaks.tobytes())
+
+
+def track_preview(elements: pygui.Elements):
+    """The waveform and loop points of the track picked in the Music Editor."""
+    stream_file = elements.state.get("music_preview")
+    if stream_file is None:
+        return
+    if not overlay().exists(stream_file):
+        elements.text(f"File not found: {stream_file}")
+        return
+    # A new key once the track is imported again.
+    key = f"waveform of {stream_file} {overlay().version(stream_file)}"
+    preview = editor_cache.get(key)
+    if preview is None:
+        preview = loaded(elements, key, load_preview, stream_file)
+        if preview is None:
+            return
+        preloader.forget(key)
+        editor_cache.put(key, preview)
+    info, peaks = preview
+
+    imgui.plot_histogram(
+        "##waveform", peaks, scale_min=0, scale_max=1, graph_size=(-1, 60)
+    )
+    description = f"{info.sample_rate} Hz, {info.channel_count} channels"
+    if info.loop:
+        left, top = imgui.get_item_rect_min()
+        right, bottom = imgui.get_item_rect_max()
+        draw_list = imgui.get_window_draw_list()
+        color = imgui.get_color_u32_rgba(1, 0.8, 0.2, 1)
+        for sample in (info.loop_start, info.sample_count):
+            x = left + (right - left) * sample / info.sample_count
+            draw_list.add_line(x, top, x, bottom, color, 2)
+        loop_start = info.loop_start / info.sample_rate
+        description += f", loops from {loop_start:.2f} s to {info.duration:.2f} s"
+    else:
+        description += f", {info.duration:.2f} s, no loop"
+    imgui.text_disabled(f"{os.path.basename(stream_file)}: {description}")
+
+
+def music_editor(elements: pygui.Elements):
+    editor = load_editor(
+        elements,
+        "music editor",
+        os.path.join("SoundData", "BgmDataBase.szs"),
+        parse_music,
+    )
+    if editor is None:
+        return
     elements.text("Music Editor", font_size=76)
 
     searched = elements.input_text("Search...", "", key="music_editor_search")
+    found = editor["music_index"].search(searched)
+    rows = editor["music_rows"]
+    track_preview(elements)
 
     imgui.new_line()
 
-    for data in bgm_stage_info_list["StageInfoList"]:
-        if searched.lower() not in data["Name"].lower():
-            continue
-        imgui.bullet_text(data["Name"])
-        imgui.indent()
-        imgui.indent()
-        for scenario in data["StageScenarioInfoList"]:
-            imgui.bullet_text(f"Scenario Number: {scenario['ScenarioNo']}")
-            imgui.indent()
-            imgui.indent()
-            for music_info in scenario["StagePlayInfoList"]:
-                imgui.bullet_text(f"Name: {music_info['Name']}")
-
-                imgui.same_line()
-
-                @elements.button(
-                    "Loading..."
-                    if elements.state.get(
-                        f"music_editor_export_{data['Name']}_{scenario['ScenarioNo']}_{music_info['Name']}_loading"
-                    )
-                    else "Export",
-                    key=f"music_editor_export_{data['Name']}_{scenario['ScenarioNo']}_{music_info['Name']}",
-                )
-                def export_button():
-                    elements.state[
-                        f"music_editor_export_{data['Name']}_{scenario['ScenarioNo']}_{music_info['Name']}_loading"
-                    ] = True
-                    loop.create_task(
-                        run_export_song(elements.state, data, music_info, scenario)
-                    )
-
-                imgui.same_line()
-
-                @elements.button(
-                    "Loading..."
-                    if elements.state.get(
-                        f"music_editor_import_{data['Name']}_{scenario['ScenarioNo']}_{music_info['Name']}_loading"
-                    )
-                    else "Import",
-                    key=f"music_editor_import_{data['Name']}_{scenario['ScenarioNo']}_{music_info['Name']}",
-                )
-                def import_button():
-                    elements.state[
-                        f"music_editor_import_{data['Name']}_{scenario['ScenarioNo']}_{music_info['Name']}_loading"
-                    ] = True
-                    loop.create_task(
-                        run_import_song(elements.state, data, music_info, scenario)
-                    )
-
-            imgui.unindent()
-            imgui.unindent()
-        imgui.unindent()
-        imgui.unindent()
-
-
-storage_directory = user_config_dir("Super Mario Odyssey Modding Tool")
-
-if not os.path.exists(storage_directory):
-    os.makedirs(storage_directory)
-
-if os.path.exists(os.path.join(storage_directory, "config.json")):
-    with open(os.path.join(storage_directory, "config.json"), "r") as f:
-        data = json.load(f)
-        window.state["romfs_path"] = data["romfs"]
-        window.state["patches_path"] = data["patches"]
-
-try:
-    window.start()
-finally:
-    with open(os.path.join(storage_directory, "config.json"), "w") as f:
-        json.dump(
-            {
-                "romfs": window.state["romfs_path"],
-                "patches": window.state["patches_path"],
-            },
-            f,
+    indent_width = imgui.get_style().indent_spacing * 2
+    for index in clipped_rows(len(found), imgui.get_frame_height_with_spacing()):
+        row = rows[found[index]]
+        if row.depth:
+            imgui.indent(indent_width * row.depth)
+        music_editor_row(elements, row)
+        if row.depth:
+            imgui.unindent(indent_width * row.depth)
+
+
+def index_romfs(state: pygui.elements.State):
+    def progress(done: int, total: int) -> None:
+        state["romfs_index_status"] = f"Indexing [{done}/{total}]"
+
+    indexed, unchanged, removed = romfs_index.update(
+        state["romfs_path"], state["patches_path"], progress=progress
+    )
+    state["romfs_index_status"] = (
+        f"{indexed} archives indexed, {unchanged} unchanged, {removed} removed"
+    )
+    state["romfs_search_query"] = None  # Search again
+
+
+def romfs_search(elements: pygui.Elements):
+    elements.text("RomFS Search", font_size=76)
+
+    @elements.button(job_label("romfs index", "Index RomFS"))
+    def index_button():
+        scheduler.submit("index", "romfs index", index_romfs, elements.state)
+
+    job_error("romfs index")
+    imgui.same_line()
+    imgui.text_disabled(elements.state.get("romfs_index_status", ""))
+
+    query = elements.input_text("Key or value...", "", key="romfs_search")
+    if query != elements.state.get("romfs_search_query"):
+        elements.state["romfs_search_query"] = query
+        elements.state["romfs_search_hits"] = (
+            romfs_index.search(query, 500) if query else []
         )
+    hits = elements.state["romfs_search_hits"]
+
+    imgui.new_line()
+
+    for index in clipped_rows(len(hits), imgui.get_text_line_height_with_spacing() * 2):
+        hit = hits[index]
+        imgui.text(f"{hit.archive}: {hit.member}")
+        imgui.text_disabled(f"    {hit.path} = {hit.value}")
+
+
+# Worker processes (like the RomFS indexer's) import this module again, they
+# must not open the window.
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Frozen builds start workers through here
+
+    storage_directory = user_config_dir("Super Mario Odyssey Modding Tool")
+
+    if not os.path.exists(storage_directory):
+        os.makedirs(storage_directory)
+
+    szs_cache = SzsCache(os.path.join(storage_directory, "szs_cache"))
+    romfs_index = RomfsIndex(os.path.join(storage_directory, "romfs_index.sqlite"))
+    AudioTools.cache = ConversionCache(
+        os.path.join(storage_directory, "conversion_cache")
+    )
+
+    if os.path.exists(os.path.join(storage_directory, "config.json")):
+        with open(os.path.join(storage_directory, "config.json"), "r") as f:
+            data = json.load(f)
+            window.state["romfs_path"] = data["romfs"]
+            window.state["patches_path"] = data["patches"]
+            window.state["compression_level"] = data.get(
+                "compression_level", "balanced"
+            )
+            editor_cache.max_bytes = data.get(
+                "editor_cache_bytes", editor_cache.max_bytes
+            )
+
+    if not folder_status.error(
+        window.state.get("romfs_path"), window.state.get("patches_path")
+    ):
+        # Decode the editors' archives while the window is being created.
+        for path in EDITOR_ARCHIVES:
+            preloader.load(path, decode_archive, path)
+
+    try:
+        window.start()
+    finally:
+        with open(os.path.join(storage_directory, "config.json"), "w") as f:
+            json.dump(
+                {
+                    "romfs": window.state["romfs_path"],
+                    "patches": window.state["patches_path"],
+                    "compression_level": window.state.get(
+                        "compression_level", "balanced"
+                    ),
+                    "editor_cache_bytes": editor_cache.max_bytes,
+                },
+                f,
+            )
@@ -0,0 +1,148 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Set
+
+
+def deep_size(value: Any) -> int:
+    """
+    Roughly how many bytes value and everything it references take.
+
+    Memoryviews count the buffer they view once, however many views of it there
+    are, so an archive costs about its decompressed size.
+    """
+    seen: Set[int] = set()
+    size = 0
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        if isinstance(value, memoryview):
+            stack.append(value.obj)
+            size += sys.getsizeof(value)
+            continue
+        size += sys.getsizeof(value)
+        if isinstance(value, (str, bytes, bytearray, int, float, bool)):
+            continue
+        if isinstance(value, dict):
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            stack.extend(value)
+        if hasattr(value, "__dict__"):
+            stack.append(vars(value))
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "size", "pinned", "used")
+
+    def __init__(self, value: Any, size: int, pinned: Optional[Callable[[], bool]]):
+        self.value = value
+        self.size = size
+        self.pinned = pinned
+        self.used = time.monotonic()
+
+
+class MemoryCache:
+    """
+    Values that are expensive to load, kept in memory up to max_bytes.
+
+    The least recently used values are evicted first, except pinned ones (whose
+    pinned() returns True, like an editor with unsaved edits) and ones used in
+    the last keep_seconds, which something is still showing. Both can take the
+    cache over its budget until they are released.
+    """
+
+    def __init__(self, max_bytes: int, keep_seconds: float = 1.0) -> None:
+        self.max_bytes = max_bytes
+        self.keep_seconds = keep_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0  # Values that had to be loaded
+        self.evictions = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            entry.used = time.monotonic()
+            self.hits += 1
+            return entry.value
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        size: Optional[int] = None,
+        pinned: Optional[Callable[[], bool]] = None,
+    ) -> Any:
+        """Add a freshly loaded value and return it."""
+        if size is None:
+            size = deep_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old.size
+            self._entries[key] = _Entry(value, size, pinned)
+            self.bytes += size
+            self.misses += 1
+            self._trim()
+        return value
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self.bytes -= entry.size
+            return entry.value
+
+    def pinned(self) -> List[Hashable]:
+        """The keys of the values that can't be evicted right now."""
+        with self._lock:
+            return [
+                key
+                for key, entry in self._entries.items()
+                if entry.pinned is not None and entry.pinned()
+            ]
+
+    def clear(self) -> None:
+        """Drop every value, pinned or not."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def trim(self) -> int:
+        """Evict down to the budget, returns how many values were evicted."""
+        with self._lock:
+            return self._trim()
+
+    def _trim(self) -> int:
+        if self.bytes <= self.max_bytes:
+            return 0
+        recent = time.monotonic() - self.keep_seconds
+        evicted = 0
+        for key, entry in list(self._entries.items()):
+            if self.bytes <= self.max_bytes:
+                break
+            if entry.used > recent or (entry.pinned is not None and entry.pinned()):
+                continue
+            del self._entries[key]
+            self.bytes -= entry.size
+            evicted += 1
+        self.evictions += evicted
+        return evicted
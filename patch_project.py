@@ -0,0 +1,235 @@
+"""
+Build a patches folder from a patch project.
+
+    python patch_project.py PROJECT [--romfs ROMFS] [--output PATCHES] [--jobs N]
+
+A project is a JSON file of edits to BYML values inside RomFS archives:
+
+    {
+        "romfs": "../romfs",
+        "output": "../patches",
+        "compression": "balanced",
+        "archives": {
+            "SystemData/ItemList.szs": {
+                "ItemList.byml": {"0/Price": 500}
+            }
+        }
+    }
+
+Key paths are the ones romfs_index.py shows. Only archives whose edits,
+compression or RomFS original changed since the last build are rebuilt, in
+parallel. A manifest in the output folder records the SHA-256 of every output,
+so deploys can copy just the files that changed.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+MANIFEST_NAME = ".patch_build.json"
+
+Edits = Dict[str, Dict[str, object]]  # member -> key path -> value
+
+
+class Project(NamedTuple):
+    romfs: str
+    output: str
+    compression: str
+    archives: Dict[str, Edits]
+
+
+class Result(NamedTuple):
+    built: List[str]
+    unchanged: List[str]
+    removed: List[str]
+
+
+def load_project(
+    path: str, romfs: Optional[str] = None, output: Optional[str] = None
+) -> Project:
+    """
+    Read a project. Folders given here are used as they are, the ones in the
+    file are relative to the file.
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    if not romfs and data.get("romfs"):
+        romfs = os.path.join(base, data["romfs"])
+    if not output and data.get("output"):
+        output = os.path.join(base, data["output"])
+    if not romfs or not output:
+        raise ValueError("The project needs a RomFS and an output folder")
+    return Project(
+        romfs,
+        output,
+        data.get("compression", "balanced"),
+        data.get("archives", {}),
+    )
+
+
+def _key(node, key: str):
+    return int(key) if isinstance(node, list) else key
+
+
+def apply_edits(data: bytes, edits: Dict[str, object]) -> bytes:
+    """Set the values at key paths of a BYML document."""
+    import byml
+
+    from byml_patch import BymlPatcher
+
+    document = byml.Byml(data)
+    root = document.parse()
+    changes = {}
+    for key_path, value in edits.items():
+        node = root
+        path = []
+        try:
+            for key in key_path.split("/"):
+                path.append(_key(node, key))
+                parent, node = node, node[path[-1]]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise ValueError(f"No value at {key_path}") from None
+        if isinstance(node, (dict, list)):
+            raise ValueError(f"{key_path} is not a single value")
+        parent[path[-1]] = changes[tuple(path)] = type(node)(value)
+    patcher = BymlPatcher(data)
+    if patcher.apply(changes):
+        return patcher.get_bytes()
+    return byml.Writer(root, document._be, 3).get_bytes()
+
+
+def build_archive(
+    source: str, target: str, edits: Edits, compression: str
+) -> Tuple[str, int]:
+    """Build one output archive, run in the worker processes."""
+    from szs import decode_szs, export_szs
+
+    archive = decode_szs(source)
+    for member, values in edits.items():
+        if member not in archive:
+            raise ValueError(f"{os.path.basename(source)} has no {member}")
+        archive[member] = apply_edits(bytes(archive[member]), values)
+    # Replaces the target in one step, and leaves it alone if it already has
+    # this content.
+    export_szs(archive, target, compression)
+    return _file_hash(target), os.path.getsize(target)
+
+
+def _inputs_hash(edits: Edits, compression: str) -> str:
+    data = json.dumps([edits, compression], sort_keys=True).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def build(project: Project, workers: Optional[int] = None) -> Result:
+    manifest_path = os.path.join(project.output, MANIFEST_NAME)
+    try:
+        with open(manifest_path, "r") as f:
+            previous = json.load(f)["outputs"]
+    except (OSError, ValueError, KeyError):
+        previous = {}
+
+    outputs = {}
+    jobs = {}
+    unchanged = []
+    for name, edits in project.archives.items():
+        source = os.path.join(project.romfs, *name.split("/"))
+        target = os.path.join(project.output, *name.split("/"))
+        stat = os.stat(source)
+        entry = {
+            "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns,
+            "inputs": _inputs_hash(edits, project.compression),
+        }
+        old = previous.get(name, {})
+        if all(old.get(k) == v for k, v in entry.items()) and os.path.exists(target):
+            target_stat = os.stat(target)
+            if (target_stat.st_size, target_stat.st_mtime_ns) == (
+                old.get("size"),
+                old.get("mtime_ns"),
+            ):
+                outputs[name] = old
+                unchanged.append(name)
+                continue
+        outputs[name] = entry
+        jobs[name] = (source, target, edits, project.compression)
+
+    removed = []
+    for name in set(previous) - set(project.archives):
+        target = os.path.join(project.output, *name.split("/"))
+        # Only remove outputs nobody changed since they were built.
+        if os.path.exists(target) and _file_hash(target) == previous[name]["sha256"]:
+            os.remove(target)
+            removed.append(name)
+
+    built = []
+    try:
+        if jobs:
+            with ProcessPoolExecutor(workers) as executor:
+                futures = {}
+                for name, job in jobs.items():
+                    os.makedirs(os.path.dirname(job[1]), exist_ok=True)
+                    futures[executor.submit(build_archive, *job)] = name
+                for future in as_completed(futures):
+                    name = futures[future]
+                    sha256, size = future.result()
+                    target_stat = os.stat(jobs[name][1])
+                    outputs[name].update(
+                        sha256=sha256, size=size, mtime_ns=target_stat.st_mtime_ns
+                    )
+                    built.append(name)
+    finally:
+        # Whatever was built is recorded, even if another archive failed. The
+        # ones that failed keep their last build, to be removed or rebuilt.
+        recorded = {
+            name: entry if "sha256" in entry else previous[name]
+            for name, entry in outputs.items()
+            if "sha256" in entry or name in previous
+        }
+        os.makedirs(project.output, exist_ok=True)
+        with open(manifest_path, "w") as f:
+            json.dump({"outputs": recorded}, f, indent=2, sort_keys=True)
+    return Result(sorted(built), sorted(unchanged), sorted(removed))
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("project", help="Patch project JSON file")
+    parser.add_argument("--romfs", help="Super Mario Odyssey RomFS")
+    parser.add_argument("--output", help="Folder to build the patches in")
+    parser.add_argument(
+        "--jobs", type=int, help="Parallel builds, by default one per CPU"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        project = load_project(args.project, args.romfs, args.output)
+        result = build(project, args.jobs)
+    except (OSError, ValueError) as e:
+        print(f"Build failed: {e}", file=sys.stderr)
+        return 1
+    for name in result.built:
+        print(f"built {name}")
+    for name in result.removed:
+        print(f"removed {name}")
+    print(
+        f"{len(result.built)} built, {len(result.unchanged)} unchanged, "
+        f"{len(result.removed)} removed"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
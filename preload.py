@@ -0,0 +1,81 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Load(Generic[T]):
+    """A load running in the background and how far it got."""
+
+    def __init__(self) -> None:
+        self.progress = 0.0
+        self.status = "Waiting..."
+        self.future: "Future[T]" = Future()
+
+    def report(self, progress: float, status: str) -> None:
+        self.progress = progress
+        self.status = status
+
+    @property
+    def done(self) -> bool:
+        return self.future.done()
+
+    @property
+    def error(self) -> Optional[BaseException]:
+        return self.future.exception() if self.future.done() else None
+
+    def result(self) -> T:
+        return self.future.result()
+
+
+class Preloader:
+    """
+    Loads things on background threads, so frames never wait for them.
+
+    Loads are keyed by what they load (usually a path). Asking for a key that
+    is already loading or loaded shares that load instead of starting another
+    one, until the key is forgotten.
+    """
+
+    def __init__(self, workers: int = 2) -> None:
+        self._lock = threading.Lock()
+        self._loads: Dict[Hashable, Load] = {}
+        # Loading is mostly Python code holding the GIL, a second thread
+        # only keeps a short load from waiting behind a long one.
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="preload")
+
+    def load(self, key: Hashable, function: Callable[..., T], *args) -> Load[T]:
+        """
+        Start function(load, *args) unless key is loaded already. The function
+        can report its progress on the Load it gets.
+        """
+        with self._lock:
+            load = self._loads.get(key)
+            if load is None:
+                self._loads[key] = load = Load()
+                self._executor.submit(self._run, load, function, args)
+        return load
+
+    @staticmethod
+    def _run(load: Load, function: Callable, args: tuple) -> None:
+        if not load.future.set_running_or_notify_cancel():
+            return
+        try:
+            result = function(load, *args)
+        except BaseException as e:
+            load.future.set_exception(e)
+        else:
+            load.report(1.0, "Done")
+            load.future.set_result(result)
+
+    def forget(self, key: Hashable) -> None:
+        with self._lock:
+            self._loads.pop(key, None)
+
+    def clear(self) -> None:
+        """Forget everything, for when the selected folders change."""
+        with self._lock:
+            loads, self._loads = self._loads, {}
+        for load in loads.values():
+            load.future.cancel()
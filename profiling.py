@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional
+
+
+class Profiler:
+    """
+    Timed spans of work and frame times, kept in memory.
+
+    Spans are cheap enough to leave in place everywhere; only the last
+    max_events of them and the last max_frames frame times are kept. export()
+    writes them in the Chrome trace format, which chrome://tracing and
+    https://ui.perfetto.dev can open.
+    """
+
+    def __init__(self, max_events: int = 50000, max_frames: int = 600) -> None:
+        self._start = time.perf_counter()
+        self.events: Deque[dict] = deque(maxlen=max_events)
+        self.frame_times: Deque[float] = deque(maxlen=max_frames)
+        self._threads: Dict[int, str] = {}
+        self._frame: Optional[float] = None
+        self._frame_started: Optional[float] = None
+        self.startup: Optional[float] = None  # Milliseconds to the first frame
+
+    def _now(self) -> float:
+        """Microseconds since the profiler was created."""
+        return (time.perf_counter() - self._start) * 1e6
+
+    def _add(self, name: str, category: str, start: float, duration: float, args):
+        thread = threading.current_thread()
+        self._threads[thread.ident] = thread.name
+        self.events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start,
+                "dur": duration,
+                "pid": os.getpid(),
+                "tid": thread.ident,
+                "args": args,
+            }
+        )
+
+    @contextmanager
+    def span(self, name: str, category: str = "tool", **args) -> Iterator[None]:
+        start = self._now()
+        try:
+            yield
+        finally:
+            self._add(name, category, start, self._now() - start, args)
+
+    def frame(self, frame_id: float) -> bool:
+        """
+        Note that a frame is being drawn. frame_id must stay the same during a
+        frame (imgui.get_time() does). Returns True once per frame.
+        """
+        if frame_id == self._frame:
+            return False
+        now = self._now()
+        if self._frame_started is not None:
+            duration = now - self._frame_started
+            self.frame_times.append(duration / 1000)
+            self._add("frame", "frame", self._frame_started, duration, {})
+        else:
+            self.startup = now / 1000
+            self._add("startup", "frame", 0, now, {})
+        self._frame = frame_id
+        self._frame_started = now
+        return True
+
+    def percentiles(self, *percents: float) -> List[float]:
+        """Frame time percentiles in milliseconds."""
+        times = sorted(self.frame_times)
+        if not times:
+            return [0.0 for _ in percents]
+        return [
+            times[min(int(len(times) * percent / 100), len(times) - 1)]
+            for percent in percents
+        ]
+
+    def export(self, path: str) -> None:
+        events = list(self.events)
+        for tid, name in list(self._threads.items()):
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+            )
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+profiler = Profiler()
+span = profiler.span
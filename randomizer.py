@@ -0,0 +1,184 @@
+"""
+Shuffle the files of a RomFS folder into the patches folder.
+
+    python randomizer.py ROMFS PATCHES [--folder SoundData/stream] [--seed SEED]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+from typing import Dict, List, Literal, NamedTuple, Optional
+
+LinkMode = Literal["auto", "reflink", "hardlink", "symlink", "copy"]
+
+MANIFEST_NAME = ".randomizer.json"
+
+_FICLONE = 0x40049409  # Linux ioctl to share the extents of another file
+
+
+def _reflink(source: str, target: str) -> None:
+    import fcntl  # Not available on Windows
+
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+
+
+def place(source: str, target: str, mode: LinkMode = "auto") -> str:
+    """
+    Make target have the contents of source, return the mode that was used.
+
+    "auto" tries a reflink and falls back to a copy. Hard and symbolic links
+    are only made when asked for, since anything that writes into a linked
+    file changes the RomFS file behind it.
+    """
+    if os.path.lexists(target):
+        os.remove(target)
+    modes = ("reflink", "copy") if mode == "auto" else (mode,)
+    for candidate in modes:
+        try:
+            if candidate == "reflink":
+                _reflink(source, target)
+            elif candidate == "hardlink":
+                os.link(source, target)
+            elif candidate == "symlink":
+                os.symlink(os.path.abspath(source), target)
+            else:
+                shutil.copyfile(source, target)
+            return candidate
+        except (OSError, ImportError, NotImplementedError):
+            if candidate == modes[-1]:
+                raise
+    raise ValueError(f"Unknown link mode: {mode}")
+
+
+def shuffle(names: List[str], seed: int) -> Dict[str, str]:
+    """Map every name to the name whose contents it gets."""
+    names = sorted(names)
+    return dict(zip(random.Random(seed).sample(names, len(names)), names))
+
+
+class Result(NamedTuple):
+    seed: int
+    changed: int
+    unchanged: int
+
+
+def _read_manifest(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"folders": {}}
+    if not isinstance(manifest.get("folders"), dict):
+        manifest["folders"] = {}
+    return manifest
+
+
+def _write_manifest(path: str, manifest: dict) -> None:
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def randomize(
+    romfs: str,
+    patches: str,
+    folder: str = os.path.join("SoundData", "stream"),
+    seed: Optional[int] = None,
+    mode: LinkMode = "auto",
+) -> Result:
+    """
+    Shuffle the files of a RomFS folder into the same folder of patches.
+
+    The same seed always gives the same shuffle. A manifest in the patches
+    folder, outside of the files the game loads, remembers what every file was
+    made from, so a re-run only touches the files whose source changed.
+    """
+    if seed is None:
+        seed = random.randrange(2**32)
+    source_folder = os.path.join(romfs, folder)
+    target_folder = os.path.join(patches, folder)
+    names = [entry.name for entry in os.scandir(source_folder) if entry.is_file()]
+    mapping = shuffle(names, seed)
+
+    os.makedirs(target_folder, exist_ok=True)
+    manifest_path = os.path.join(patches, MANIFEST_NAME)
+    manifest = _read_manifest(manifest_path)
+    folder_key = "/".join(os.path.normpath(folder).split(os.sep))
+    previous = manifest["folders"].get(folder_key, {}).get("files", {})
+
+    files = {}
+    changed = unchanged = 0
+    try:
+        for target_name, source_name in mapping.items():
+            source = os.path.join(source_folder, source_name)
+            target = os.path.join(target_folder, target_name)
+            stat = os.stat(source)
+            entry = {
+                "source": source_name,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+            }
+            old = previous.get(target_name)
+            if (
+                old
+                and os.path.lexists(target)
+                and all(old.get(k) == v for k, v in entry.items())
+                and (
+                    old.get("mode") == mode
+                    or (mode == "auto" and old.get("mode") in ("reflink", "copy"))
+                )
+            ):
+                files[target_name] = old
+                unchanged += 1
+                continue
+            entry["mode"] = place(source, target, mode)
+            files[target_name] = entry
+            changed += 1
+
+        for target_name in set(previous) - set(files):
+            target = os.path.join(target_folder, target_name)
+            if os.path.lexists(target):
+                os.remove(target)
+    finally:
+        manifest["folders"][folder_key] = {"seed": seed, "files": files}
+        _write_manifest(manifest_path, manifest)
+    return Result(seed, changed, unchanged)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("romfs", help="Super Mario Odyssey RomFS")
+    parser.add_argument("patches", help="Folder to save patches to")
+    parser.add_argument(
+        "--folder",
+        default=os.path.join("SoundData", "stream"),
+        help="RomFS folder to shuffle, by default the music",
+    )
+    parser.add_argument("--seed", type=int, help="Seed to reproduce a shuffle")
+    parser.add_argument(
+        "--mode",
+        choices=("auto", "reflink", "hardlink", "symlink", "copy"),
+        default="auto",
+        help="How to create the shuffled files",
+    )
+    args = parser.parse_args(argv)
+    result = randomize(args.romfs, args.patches, args.folder, args.seed, args.mode)
+    print(
+        f"Seed {result.seed}: {result.changed} files written, "
+        f"{result.unchanged} unchanged"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
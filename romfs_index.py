@@ -0,0 +1,342 @@
+"""
+Index the archives of a RomFS, to find which one has a BYML key or value.
+
+    python romfs_index.py index --romfs ROMFS [--patches PATCHES] [--jobs N]
+    python romfs_index.py search TEXT [--limit 50]
+
+Every .szs file is decoded and every BYML member in it flattened into key
+paths ("Objs/0/UnitConfigName") and values, stored in a SQLite database. A
+re-run only decodes the archives whose size or modification time changed.
+"""
+
+import argparse
+import os
+import sqlite3
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from appdirs import user_config_dir
+
+Entries = List[Tuple[str, str]]
+Member = Tuple[str, int, Entries]  # name, size, (key path, value) pairs
+Progress = Callable[[int, int], None]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    file TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    id INTEGER PRIMARY KEY,
+    archive_id INTEGER NOT NULL REFERENCES archives(id),
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS members_archive ON members(archive_id);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    member_id INTEGER NOT NULL REFERENCES members(id),
+    path TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_member ON entries(member_id);
+"""
+
+# Substring search in milliseconds, where SQLite is new enough (3.34) to have
+# the trigram tokenizer. Older versions fall back to LIKE.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    path, value, content='entries', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts(rowid, path, value)
+    VALUES (new.id, new.path, new.value);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts(entries_fts, rowid, path, value)
+    VALUES ('delete', old.id, old.path, old.value);
+END;
+"""
+
+_BYML_ERRORS = (ValueError, KeyError, IndexError, UnicodeDecodeError, struct.error)
+
+
+class Hit(NamedTuple):
+    archive: str
+    member: str
+    path: str
+    value: str
+
+
+def default_database() -> str:
+    return os.path.join(
+        user_config_dir("Super Mario Odyssey Modding Tool"), "romfs_index.sqlite"
+    )
+
+
+def flatten(node, path: str = "") -> Iterator[Tuple[str, str]]:
+    """The (key path, value) pairs of the scalar values in a BYML tree."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from flatten(value, f"{path}/{key}" if path else key)
+    elif isinstance(node, list):
+        for index, value in enumerate(node):
+            yield from flatten(value, f"{path}/{index}" if path else str(index))
+    elif not isinstance(node, bytes) and node is not None:
+        yield path, str(node)
+
+
+def read_members(data: bytes, prefix: str = "") -> List[Member]:
+    import byml
+
+    from sarc import SarcArchive
+    from szs import decompress_szs
+
+    members = []
+    archive = SarcArchive(data)
+    for name in archive:
+        member = bytes(archive[name])
+        name = prefix + name
+        if member[:4] in (b"Yaz0", b"SARC"):
+            # Archives inside archives, like the .szs files of a .pack.
+            try:
+                members.extend(read_members(decompress_szs(member), name + "/"))
+                continue
+            except ValueError:
+                pass
+        entries: Entries = []
+        if member[:2] in (b"BY", b"YB"):
+            try:
+                entries = list(flatten(byml.Byml(member).parse()))
+            except _BYML_ERRORS:
+                entries = []
+        members.append((name, len(member), entries))
+    return members
+
+
+def read_archive(file: str) -> List[Member]:
+    """
+    Decode one .szs file, run in the worker processes. A file that is not a
+    valid archive has no members.
+    """
+    from szs import decompress_szs
+
+    with open(file, "rb") as f:
+        data = f.read()
+    try:
+        return read_members(decompress_szs(data))
+    except _BYML_ERRORS:
+        return []
+
+
+def archive_files(romfs_path: str, patches_path: Optional[str]) -> Dict[str, str]:
+    """Every .szs file by its RomFS relative path, patched copies win."""
+    files = {}
+    for root in (romfs_path, patches_path):
+        if not root:
+            continue
+        for folder, _, names in os.walk(root):
+            for name in names:
+                if name.endswith(".szs"):
+                    file = os.path.join(folder, name)
+                    relative = os.path.relpath(file, root).replace(os.sep, "/")
+                    files[relative] = file
+    return files
+
+
+class RomfsIndex:
+    def __init__(self, database: str) -> None:
+        self.database = database
+        directory = os.path.dirname(os.path.abspath(database))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        connection = self._connect()
+        try:
+            connection.executescript(SCHEMA)
+            try:
+                connection.executescript(FTS_SCHEMA)
+                self.full_text = True
+            except sqlite3.OperationalError:
+                self.full_text = False
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per use, connections can't move between threads.
+        return sqlite3.connect(self.database)
+
+    def update(
+        self,
+        romfs_path: str,
+        patches_path: Optional[str] = None,
+        workers: Optional[int] = None,
+        progress: Optional[Progress] = None,
+    ) -> Tuple[int, int, int]:
+        """
+        Index new and changed archives and drop removed ones.
+        Returns how many were indexed, unchanged and removed.
+
+        Archives that could not be read are left out, to be tried again on the
+        next run, and the first error is raised once the others are indexed.
+        """
+        files = archive_files(romfs_path, patches_path)
+        stats = {path: os.stat(file) for path, file in files.items()}
+        connection = self._connect()
+        try:
+            known = {
+                path: (id_, file, size, mtime_ns)
+                for id_, path, file, size, mtime_ns in connection.execute(
+                    "SELECT id, path, file, size, mtime_ns FROM archives"
+                )
+            }
+            changed = [
+                path
+                for path, file in files.items()
+                if known.get(path, (None,))[1:]
+                != (file, stats[path].st_size, stats[path].st_mtime_ns)
+            ]
+            removed = [path for path in known if path not in files]
+            with connection:
+                for path in removed:
+                    self._delete(connection, known[path][0])
+
+            if not changed:
+                return 0, len(files), len(removed)
+            error: Optional[Exception] = None
+            with ProcessPoolExecutor(workers) as executor:
+                futures = {
+                    executor.submit(read_archive, files[path]): path for path in changed
+                }
+                for done, future in enumerate(as_completed(futures), 1):
+                    path = futures[future]
+                    try:
+                        members = future.result()
+                    except Exception as e:
+                        # Not recorded, so the next run reads it again.
+                        error = error or e
+                    else:
+                        with connection:
+                            if path in known:
+                                self._delete(connection, known[path][0])
+                            self._insert(
+                                connection, path, files[path], stats[path], members
+                            )
+                    if progress is not None:
+                        progress(done, len(changed))
+        finally:
+            connection.close()
+        if error is not None:
+            raise error
+        return len(changed), len(files) - len(changed), len(removed)
+
+    @staticmethod
+    def _delete(connection: sqlite3.Connection, archive_id: int) -> None:
+        members = "SELECT id FROM members WHERE archive_id = ?"
+        connection.execute(
+            f"DELETE FROM entries WHERE member_id IN ({members})", (archive_id,)
+        )
+        connection.execute("DELETE FROM members WHERE archive_id = ?", (archive_id,))
+        connection.execute("DELETE FROM archives WHERE id = ?", (archive_id,))
+
+    @staticmethod
+    def _insert(
+        connection: sqlite3.Connection,
+        path: str,
+        file: str,
+        stat: os.stat_result,
+        members: List[Member],
+    ) -> None:
+        archive_id = connection.execute(
+            "INSERT INTO archives (path, file, size, mtime_ns) VALUES (?, ?, ?, ?)",
+            (path, file, stat.st_size, stat.st_mtime_ns),
+        ).lastrowid
+        for name, size, entries in members:
+            member_id = connection.execute(
+                "INSERT INTO members (archive_id, name, size) VALUES (?, ?, ?)",
+                (archive_id, name, size),
+            ).lastrowid
+            connection.executemany(
+                "INSERT INTO entries (member_id, path, value) VALUES (?, ?, ?)",
+                ((member_id, key, value) for key, value in entries),
+            )
+
+    def search(self, text: str, limit: int = 100) -> List[Hit]:
+        """Entries whose key path or value contains text, ignoring case."""
+        select = (
+            "SELECT archives.path, members.name, entries.path, entries.value "
+            "FROM entries JOIN members ON members.id = entries.member_id "
+            "JOIN archives ON archives.id = members.archive_id "
+        )
+        connection = self._connect()
+        try:
+            # Trigrams need three characters to look anything up.
+            if self.full_text and len(text) >= 3:
+                rows = connection.execute(
+                    select + "WHERE entries.id IN (SELECT rowid FROM entries_fts "
+                    "WHERE entries_fts MATCH ?) LIMIT ?",
+                    ('"' + text.replace('"', '""') + '"', limit),
+                )
+            else:
+                pattern = "%" + text.replace("%", r"\%").replace("_", r"\_") + "%"
+                rows = connection.execute(
+                    select + "WHERE entries.path LIKE ? ESCAPE '\\' "
+                    "OR entries.value LIKE ? ESCAPE '\\' LIMIT ?",
+                    (pattern, pattern, limit),
+                )
+            return [Hit(*row) for row in rows]
+        finally:
+            connection.close()
+
+    def counts(self) -> Tuple[int, int, int]:
+        """How many archives, members and entries are indexed."""
+        connection = self._connect()
+        try:
+            return tuple(
+                connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("archives", "members", "entries")
+            )
+        finally:
+            connection.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--database", default=default_database(), help="Index file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index = commands.add_parser("index", help="Index new and changed archives")
+    index.add_argument("--romfs", required=True, help="Super Mario Odyssey RomFS")
+    index.add_argument("--patches", help="Patches folder, indexed over the RomFS")
+    index.add_argument(
+        "--jobs", type=int, help="Parallel decodes, by default one per CPU"
+    )
+    search = commands.add_parser("search", help="Find key paths and values")
+    search.add_argument("text", help="Text to look for, case insensitive")
+    search.add_argument("--limit", type=int, default=50, help="Most results to show")
+    args = parser.parse_args(argv)
+
+    romfs_index = RomfsIndex(args.database)
+    if args.command == "index":
+
+        def progress(done: int, total: int) -> None:
+            print(f"\r[{done}/{total}]", end="", file=sys.stderr, flush=True)
+
+        indexed, unchanged, removed = romfs_index.update(
+            args.romfs, args.patches, args.jobs, progress
+        )
+        print(
+            f"\n{indexed} archives indexed, {unchanged} unchanged, {removed} removed",
+            file=sys.stderr,
+        )
+    else:
+        for hit in romfs_index.search(args.text, args.limit):
+            print(f"{hit.archive}:{hit.member}:{hit.path} = {hit.value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import struct
+from typing import Dict, Iterator, NamedTuple, Optional, Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class SarcEntry(NamedTuple):
+    name_hash: int
+    has_name: bool
+    start: int
+    end: int
+
+
+def name_hash(name: str, key: int = 0x65) -> int:
+    result = 0
+    for char in name:
+        result = (result * key + ord(char)) & 0xFFFFFFFF
+    return result
+
+
+def data_alignment(data: Buffer) -> int:
+    """Alignment the game expects for a member, same table as SarcLib uses."""
+    magic = bytes(data[:8])
+    if magic[:4] == b"SARC":
+        return 0x2000
+    if magic[:4] in (b"Yaz0", b"Yaz1"):
+        return 0x80
+    if magic[:4] == b"FFNT":
+        return 0x2000
+    if magic[:4] == b"CFNT":
+        return 0x80
+    if magic[:4] in (b"CSTM", b"FSTM", b"FSTP", b"CWAV", b"FWAV"):
+        return 0x20
+    if magic in (b"BNTX\0\0\0\0", b"BNSH\0\0\0\0", b"FSHA    "):
+        return 0x1000
+    if magic[:4] in (b"Gfx2", b"FRES", b"AAHS", b"BAHS"):
+        return 0x2000
+    if bytes(data[-0x28:-0x24]) == b"FLIM":
+        return 0x2000
+    if magic[:4] == b"CTPK":
+        return 0x10
+    if magic[:4] == b"CGFX" or bytes(data[-0x28:-0x24]) == b"CLIM":
+        return 0x80
+    if magic[:4] == b"AAMP":
+        return 8
+    if magic[:2] in (b"YB", b"BY") or magic in (b"MsgStdBn", b"MsgPrjBn"):
+        return 0x80
+    if bytes(data[0xC:0x10]) == b"SCDL":
+        return 0x100
+    return 4
+
+
+def _round_up(value: int, alignment: int) -> int:
+    return (value + alignment - 1) & ~(alignment - 1)
+
+
+class SarcArchive:
+    """
+    A SARC archive indexed by member name.
+
+    The SFAT/SFNT tables are read once into a name -> entry dict; member data is
+    only sliced out of the decompressed buffer (as a memoryview) when asked for.
+    Replaced or added members are kept separately until the archive is saved.
+    """
+
+    def __init__(
+        self, data: Optional[Buffer] = None, endianness: str = "<", hash_key: int = 0x65
+    ) -> None:
+        self.endianness = endianness
+        self.hash_key = hash_key
+        self._data = memoryview(b"")
+        self._index: Dict[str, SarcEntry] = {}
+        self._changes: Dict[str, Optional[bytes]] = {}
+        if data is not None:
+            self.load(data)
+
+    def load(self, data: Buffer) -> None:
+        view = memoryview(data).cast("B")
+        if bytes(view[:4]) != b"SARC":
+            raise ValueError("This is not a valid SARC file!")
+        boms = {b"\xfe\xff": ">", b"\xff\xfe": "<"}
+        try:
+            self.endianness = boms[bytes(view[6:8])]
+        except KeyError:
+            raise ValueError("Invalid SARC byte order mark") from None
+
+        e = self.endianness
+        header_size, _, file_size, data_offset = struct.unpack_from(e + "HHII", view, 4)
+        if header_size != 0x14 or file_size != len(view):
+            raise ValueError("Invalid SARC header")
+        if bytes(view[0x14:0x18]) != b"SFAT":
+            raise ValueError("Invalid SFAT header")
+        _, node_count, self.hash_key = struct.unpack_from(e + "HHI", view, 0x18)
+        sfnt_offset = 0x20 + node_count * 0x10
+        if bytes(view[sfnt_offset : sfnt_offset + 4]) != b"SFNT":
+            raise ValueError("Invalid SFNT header")
+        names_offset = sfnt_offset + 8
+
+        index = {}
+        nodes = view[0x20:sfnt_offset]
+        for hash_, attributes, start, end in struct.iter_unpack(e + "IIII", nodes):
+            has_name = bool(attributes >> 24)
+            if has_name:
+                name_start = names_offset + (attributes & 0xFFFFFF) * 4
+                name_end = name_start
+                while view[name_end]:
+                    name_end += 1
+                name = bytes(view[name_start:name_end]).decode("utf-8")
+            else:
+                name = f"hash_{hash_:#x}.bin"
+            index[name] = SarcEntry(
+                hash_, has_name, data_offset + start, data_offset + end
+            )
+
+        self._data = view
+        self._index = index
+        self._changes = {}
+
+    def __contains__(self, name: object) -> bool:
+        if name in self._changes:
+            return self._changes[name] is not None
+        return name in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        for name in self._index:
+            if self._changes.get(name, b"") is not None:
+                yield name
+        for name, data in self._changes.items():
+            if name not in self._index and data is not None:
+                yield name
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __getitem__(self, name: str) -> memoryview:
+        if name in self._changes:
+            data = self._changes[name]
+            if data is None:
+                raise KeyError(name)
+            return memoryview(data)
+        entry = self._index[name]
+        return self._data[entry.start : entry.end]
+
+    def __setitem__(self, name: str, data: Buffer) -> None:
+        data = bytes(data)
+        entry = self._index.get(name)
+        if entry is not None and self._data[entry.start : entry.end] == data:
+            # Back to the loaded contents, nothing to save for this member.
+            self._changes.pop(name, None)
+        else:
+            self._changes[name] = data
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(name)
+        self._changes[name] = None
+
+    def get(self, name: str, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    @property
+    def modified(self) -> bool:
+        return bool(self._changes)
+
+    def save(self) -> bytes:
+        e = self.endianness
+        members = []
+        for name in self:
+            entry = self._index.get(name)
+            if entry is not None:
+                members.append((entry.name_hash, entry.has_name, name))
+            else:
+                members.append((name_hash(name, self.hash_key), True, name))
+        members.sort(key=lambda member: member[0])
+
+        names = bytearray()
+        name_offsets = []
+        for _, has_name, name in members:
+            name_offsets.append(len(names))
+            if has_name:
+                names += name.encode("utf-8")
+                names += b"\0" * (4 - len(names) % 4)
+
+        data_offset = _round_up(0x20 + len(members) * 0x10 + 8 + len(names), 4)
+        max_alignment = 4
+        chunks = []
+        nodes = bytearray()
+        position = 0
+        for (hash_, has_name, name), name_offset in zip(members, name_offsets):
+            data = self[name]
+            alignment = data_alignment(data)
+            max_alignment = max(max_alignment, alignment)
+            padding = _round_up(position, alignment) - position
+            if padding:
+                chunks.append(b"\0" * padding)
+                position += padding
+            chunks.append(data)
+            attributes = 0x1000000 | (name_offset // 4) if has_name else 0
+            nodes += struct.pack(
+                e + "IIII", hash_, attributes, position, position + len(data)
+            )
+            position += len(data)
+        data_offset = _round_up(data_offset, max_alignment)
+
+        header = bytearray(b"SARC")
+        header += struct.pack(e + "H", 0x14)
+        header += b"\xfe\xff" if e == ">" else b"\xff\xfe"
+        header += struct.pack(e + "IIHH", data_offset + position, data_offset, 0x100, 0)
+        header += b"SFAT" + struct.pack(e + "HHI", 0x0C, len(members), self.hash_key)
+        header += nodes
+        header += b"SFNT" + struct.pack(e + "HH", 0x08, 0)
+        header += names
+        header += b"\0" * (data_offset - len(header))
+        return b"".join([header, *chunks])
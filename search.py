@@ -0,0 +1,100 @@
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Set
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    Case insensitive substring search over a fixed list of documents.
+
+    Queries of three or more characters are answered from a trigram index and
+    then verified. Results are memoized per query, and a query that extends an
+    earlier one (the usual case while typing) only re-checks that earlier
+    query's results.
+    """
+
+    max_memoized = 128
+
+    def __init__(self, documents: Sequence[str]) -> None:
+        self.documents = [document.lower() for document in documents]
+        self.trigrams: Dict[str, Set[int]] = {}
+        for index, document in enumerate(self.documents):
+            for trigram in _trigrams(document):
+                self.trigrams.setdefault(trigram, set()).add(index)
+        self._results: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    def search(self, query: str) -> List[int]:
+        query = query.lower()
+        if query in self._results:
+            self._results.move_to_end(query)
+            return self._results[query]
+        result = self._search(query)
+        self._results[query] = result
+        if len(self._results) > self.max_memoized:
+            self._results.popitem(last=False)
+        return result
+
+    def _candidates(self, query: str) -> Sequence[int]:
+        # The most recent memoized query contained in this one already holds
+        # every possible match.
+        for previous in reversed(self._results):
+            if previous and previous in query:
+                return self._results[previous]
+        if len(query) < 3:
+            return range(len(self.documents))
+        sets = sorted(
+            (self.trigrams.get(trigram, set()) for trigram in _trigrams(query)),
+            key=len,
+        )
+        return sorted(set.intersection(*sets))
+
+    def _search(self, query: str) -> List[int]:
+        if not query:
+            return list(range(len(self.documents)))
+        documents = self.documents
+        return [i for i in self._candidates(query) if query in documents[i]]
+
+
+class TreeSearchIndex(SearchIndex):
+    """
+    A SearchIndex over a flattened tree, given as documents in depth first order
+    with their depths.
+
+    A match also brings in its ancestors, so it is shown in context, and its
+    descendants, so matching a parent shows everything under it.
+    """
+
+    def __init__(self, documents: Sequence[str], depths: Sequence[int]) -> None:
+        super().__init__(documents)
+        self.parents: List[int] = []
+        self.ends: List[int] = [len(depths)] * len(depths)
+        stack: List[int] = []
+        for index, depth in enumerate(depths):
+            while stack and depths[stack[-1]] >= depth:
+                self.ends[stack.pop()] = index
+            self.parents.append(stack[-1] if stack else -1)
+            stack.append(index)
+        self._matches: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    def search(self, query: str) -> List[int]:
+        query = query.lower()
+        if query in self._matches:
+            self._matches.move_to_end(query)
+            return self._matches[query]
+        visible: Set[int] = set()
+        for index in super().search(query):
+            if index in visible:
+                continue
+            visible.update(range(index, self.ends[index]))
+            parent = self.parents[index]
+            while parent != -1 and parent not in visible:
+                visible.add(parent)
+                parent = self.parents[parent]
+        result = sorted(visible)
+        self._matches[query] = result
+        if len(self._matches) > self.max_memoized:
+            self._matches.popitem(last=False)
+        return result
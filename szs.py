@@ -0,0 +1,73 @@
+import hashlib
+import os
+from typing import Optional
+
+import yaz0
+from cache import SzsCache
+from profiling import span
+from sarc import SarcArchive
+
+
+def decompress_szs(data: bytes) -> bytes:
+    import libyaz0  # Only needed once an archive is opened
+
+    with span("yaz0 decompress", size=len(data)):
+        while libyaz0.IsYazCompressed(data):
+            data = libyaz0.decompress(data)
+    return data
+
+
+def decode_szs(file: str, cache: Optional[SzsCache] = None) -> SarcArchive:
+    with span("decode_szs", file=file):
+        if cache is None:
+            with open(file, "rb") as f:
+                return SarcArchive(decompress_szs(f.read()))
+        return SarcArchive(cache.load(file, decompress_szs))
+
+
+def _sarc_hash(path: str, cache: Optional[SzsCache]) -> Optional[bytes]:
+    """The hash of the SARC in an existing .szs file, None if there is none."""
+    try:
+        if cache is not None:
+            data = cache.load(path, decompress_szs)
+        else:
+            with open(path, "rb") as f:
+                data = decompress_szs(f.read())
+    except (OSError, ValueError):
+        return None
+    return hashlib.sha256(data).digest()
+
+
+def export_szs(
+    archive: SarcArchive,
+    path: str,
+    level: yaz0.Level = "balanced",
+    cache: Optional[SzsCache] = None,
+) -> bool:
+    """
+    Write archive to path, return False if the file already had this content.
+
+    The archive counts as unmodified afterwards.
+    """
+    sarc_data = archive.save()
+    if _sarc_hash(path, cache) == hashlib.sha256(sarc_data).digest():
+        archive.load(sarc_data)
+        return False
+    with span("yaz0 compress", size=len(sarc_data), level=level):
+        data = yaz0.compress(sarc_data, level)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    # Replaced instead of written into, so a file linked to the RomFS or read
+    # by someone else never sees a half written archive.
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    if cache is not None:
+        cache.add(path, data, sarc_data)
+    archive.load(sarc_data)
+    return True
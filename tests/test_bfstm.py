@@ -0,0 +1,288 @@
+import io
+import random
+import struct
+
+import numpy as np
+import pytest
+
+from bfstm import DSP_ADPCM, PCM16, Bfstm, BfstmError, read_wav, write_bfstm
+
+BLOCK_SIZE = 0x100
+LAST_BLOCK_SIZE = 0x48
+
+
+def _reference_decode(frames: bytes, coefficients, history1, history2, samples):
+    """DSP-ADPCM one sample at a time, the way the format describes it."""
+    out = []
+    for offset in range(0, len(frames), 8):
+        header = frames[offset]
+        scale = 1 << (header & 0xF)
+        predictor = header >> 4
+        coefficient1 = coefficients[predictor * 2]
+        coefficient2 = coefficients[predictor * 2 + 1]
+        for byte in frames[offset + 1 : offset + 8]:
+            for nibble in (byte >> 4, byte & 0xF):
+                if len(out) == samples:
+                    return out
+                if nibble >= 8:
+                    nibble -= 16
+                sample = ((nibble * scale) << 11) + 1024
+                sample += coefficient1 * history1 + coefficient2 * history2
+                sample = max(-32768, min(32767, sample >> 11))
+                out.append(sample)
+                history1, history2 = sample, history1
+    return out
+
+
+def _build(e="<", channels=2, blocks=4, codec=DSP_ADPCM, seek=True, seed=1):
+    """
+    A BFSTM of random frames and what it decodes to, (samples, channels).
+    """
+    rnd = random.Random(seed)
+    if codec == DSP_ADPCM:
+        block_samples = BLOCK_SIZE // 8 * 14
+        last_block_samples = LAST_BLOCK_SIZE // 8 * 14
+    else:
+        block_samples = BLOCK_SIZE // 2
+        last_block_samples = LAST_BLOCK_SIZE // 2
+    last_padded_size = -(-LAST_BLOCK_SIZE // 0x20) * 0x20
+    coefficients = [
+        [rnd.randint(-4096, 4096) for _ in range(16)] for _ in range(channels)
+    ]
+
+    data = []  # [block][channel]
+    pcm = [[] for _ in range(channels)]
+    seek_entries = []
+    history = [(0, 0)] * channels
+    for block in range(blocks):
+        last = block == blocks - 1
+        size = LAST_BLOCK_SIZE if last else BLOCK_SIZE
+        samples = last_block_samples if last else block_samples
+        row = []
+        for channel in range(channels):
+            if codec == DSP_ADPCM:
+                raw = b"".join(
+                    bytes(
+                        [(rnd.randrange(8) << 4) | rnd.randrange(12)]
+                        + [rnd.randrange(256) for _ in range(7)]
+                    )
+                    for _ in range(size // 8)
+                )
+                decoded = _reference_decode(
+                    raw, coefficients[channel], *history[channel], samples
+                )
+            else:
+                raw = bytes(rnd.randrange(256) for _ in range(size))
+                decoded = list(struct.unpack(f"{e}{samples}h", raw))
+            seek_entries.append(history[channel])
+            history[channel] = (decoded[-1], decoded[-2])
+            pcm[channel] += decoded
+            row.append(raw)
+        data.append(row)
+    sample_count = len(pcm[0])
+
+    stream = struct.pack(
+        e + "BBBx11IHxxi",
+        codec,
+        1,
+        channels,
+        32000,
+        100,
+        sample_count,
+        blocks,
+        BLOCK_SIZE,
+        block_samples,
+        LAST_BLOCK_SIZE,
+        last_block_samples,
+        last_padded_size,
+        4,
+        block_samples,
+        0x1F00,
+        0x18,
+    )
+    channel_table = 0x18 + len(stream)
+    infos = 4 + 8 * channels
+    adpcm = infos + 8 * channels
+    table = struct.pack(e + "I", channels)
+    channel_infos = adpcm_infos = b""
+    for channel in range(channels):
+        table += struct.pack(e + "HHi", 0x4102, 0, infos + 8 * channel)
+        channel_infos += struct.pack(
+            e + "HHi", 0x0300, 0, adpcm + 0x30 * channel - infos - 8 * channel
+        )
+        adpcm_infos += struct.pack(
+            e + "16hH2hH2h4x", *coefficients[channel], 0, 0, 0, 0, 0, 0
+        )
+    references = struct.pack(
+        e + "HxxiHxxiHxxi", 0x4100, 0x18, 0, -1, 0x0101, channel_table
+    )
+    body = references + stream + table + channel_infos + adpcm_infos
+    info = b"INFO" + struct.pack(e + "I", len(body) + 8) + body
+
+    entries = b"".join(struct.pack(e + "hh", *entry) for entry in seek_entries)
+    seek_block = b"SEEK" + struct.pack(e + "I", len(entries) + 8) + entries
+
+    samples = b"\0" * 0x18
+    for block, row in enumerate(data):
+        for raw in row:
+            if block == blocks - 1:
+                raw += b"\0" * (last_padded_size - len(raw))
+            samples += raw
+    data_block = b"DATA" + struct.pack(e + "I", len(samples) + 8) + samples
+
+    sections = [(0x4000, info)]
+    if seek:
+        sections.append((0x4001, seek_block))
+    sections.append((0x4002, data_block))
+    header_size = 0x40
+    offset = header_size
+    section_table = body = b""
+    for kind, section in sections:
+        section_table += struct.pack(e + "HHII", kind, 0, offset, len(section))
+        offset += len(section)
+        body += section
+    header = b"FSTM" + (b"\xff\xfe" if e == "<" else b"\xfe\xff")
+    header += struct.pack(
+        e + "HIIHH", header_size, 0x00060100, offset, len(sections), 0
+    )
+    header += section_table
+    header += b"\0" * (header_size - len(header))
+    return header + body, np.array(pcm, np.int16).T
+
+
+def _snr(reference: np.ndarray, decoded: np.ndarray) -> float:
+    noise = reference.astype(np.float64) - decoded
+    return 10 * np.log10(np.sum(reference.astype(np.float64) ** 2) / np.sum(noise**2))
+
+
+def _tone(seconds: float, sample_rate: int, channels: int = 2) -> np.ndarray:
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    columns = [
+        np.sin(2 * np.pi * (220 + 110 * c) * t) + 0.3 * np.sin(2 * np.pi * 1250 * t)
+        for c in range(channels)
+    ]
+    return (np.array(columns).T * 12000).astype(np.int16)
+
+
+@pytest.mark.parametrize("channels", (1, 2, 3))
+@pytest.mark.parametrize("e", ("<", ">"))
+def test_decode_dsp_adpcm(e, channels):
+    data, pcm = _build(e, channels)
+    stream = Bfstm(data)
+    assert stream.info.channel_count == channels
+    assert stream.info.sample_count == len(pcm)
+    assert stream.info.loop and stream.info.loop_start == 100
+    assert stream.seek is not None
+    np.testing.assert_array_equal(stream.decode(), pcm)
+
+
+@pytest.mark.parametrize("e", ("<", ">"))
+def test_decode_without_seek(e):
+    data, pcm = _build(e, 2, seek=False)
+    stream = Bfstm(data)
+    assert stream.seek is None
+    np.testing.assert_array_equal(stream.decode(), pcm)
+
+
+@pytest.mark.parametrize("e", ("<", ">"))
+def test_decode_pcm16(e):
+    data, pcm = _build(e, 2, codec=PCM16)
+    np.testing.assert_array_equal(Bfstm(data).decode(), pcm)
+
+
+def test_chunks_match_whole_decode():
+    data, pcm = _build("<", 2, blocks=9)
+    stream = Bfstm(data)
+    chunks = list(stream.blocks(blocks_per_chunk=2))
+    assert len(chunks) == 5
+    np.testing.assert_array_equal(np.concatenate(chunks), pcm)
+
+
+@pytest.mark.parametrize(
+    "data",
+    (
+        b"",
+        b"RIFF" + bytes(60),
+        b"FSTM\x00\x00" + bytes(60),
+        b"FSTM\xff\xfe" + bytes(10),
+        b"FSTM\xff\xfe" + bytes(60),
+        b"FSTM\xfe\xff" + struct.pack(">HIIH", 0x40, 0x00060100, 0, 0xFFFF),
+    ),
+)
+def test_invalid(data):
+    with pytest.raises(BfstmError):
+        Bfstm(data)
+
+
+@pytest.mark.parametrize("cut", (0x19, 0x100, 0x400))
+def test_cut_short(cut):
+    # The last 0x18 bytes only pad the last block.
+    data, _ = _build("<", 2)
+    with pytest.raises(BfstmError):
+        Bfstm(data[:-cut])
+
+
+def test_encode_round_trip():
+    pcm = _tone(1, 32000)
+    output = io.BytesIO()
+    write_bfstm(output, pcm, 32000)
+    stream = Bfstm(output.getvalue())
+    assert stream.info.codec == DSP_ADPCM
+    assert stream.info.sample_rate == 32000
+    assert not stream.info.loop
+    decoded = stream.decode()
+    assert decoded.shape == pcm.shape
+    assert _snr(pcm, decoded) > 30
+
+
+def test_encode_loop_round_trip():
+    pcm = _tone(1, 32000)
+    output = io.BytesIO()
+    write_bfstm(output, pcm, 32000, loop=(5000, 30000))
+    stream = Bfstm(output.getvalue())
+    info = stream.info
+    assert info.loop
+    assert info.loop_start % info.block_samples == 0
+    # The loop is as long as asked for, moved to start on a block.
+    assert info.sample_count - info.loop_start == 25000
+    decoded = stream.decode()
+    loop = pcm[5000:30000]
+    moved = np.roll(loop, 5000 - info.loop_start, axis=0)
+    assert _snr(moved, decoded[info.loop_start :]) > 30
+    assert _snr(pcm[:5000], decoded[:5000]) > 30
+
+
+def test_wav_round_trip():
+    pcm = _tone(0.5, 32000)
+    output = io.BytesIO()
+    write_bfstm(output, pcm, 32000, loop=(0, len(pcm)))
+    stream = Bfstm(output.getvalue())
+    wav = io.BytesIO()
+    stream.write_wav(wav)
+    samples, sample_rate, loop = read_wav(wav.getvalue())
+    assert sample_rate == 32000
+    assert loop == (0, len(pcm))
+    np.testing.assert_array_equal(samples, stream.decode())
+
+
+def test_encode_seek_matches_continuous_decode():
+    # A sweep with noise, so the decoded and input history differ at blocks.
+    t = np.arange(3 * 32000) / 32000
+    sweep = np.sin(2 * np.pi * (100 + 2000 * t) * t) * 20000
+    noise = np.random.default_rng(0).normal(0, 2000, (len(t), 2))
+    pcm = np.clip(sweep[:, None] + noise, -32768, 32767).astype(np.int16)
+    output = io.BytesIO()
+    write_bfstm(output, pcm, 32000, loop=(20000, len(pcm)))
+    stream = Bfstm(output.getvalue())
+    assert stream.info.block_count > 4
+    from_seek = stream.decode()
+    stream.seek = None
+    continuous = stream.decode()
+    np.testing.assert_array_equal(continuous, from_seek)
+    assert _snr(pcm, continuous[: len(pcm)]) > 25
+    # Jumping back to the loop start continues from what was played there.
+    start = stream.info.loop_start
+    for channel, info in enumerate(stream.channels):
+        np.testing.assert_array_equal(
+            info.loop_history, continuous[start - 2 : start, channel][::-1]
+        )
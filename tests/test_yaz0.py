@@ -0,0 +1,63 @@
+import random
+import struct
+
+import libyaz0
+import pytest
+
+import yaz0
+
+LEVELS = ("store", "fast", "balanced", "max")
+
+
+def _random(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def _window_edge(distance: int) -> bytes:
+    """A block repeated exactly distance bytes later, with noise in between."""
+    block = _random(64, 1)
+    return block + _random(distance - len(block), 2) + block + b"end"
+
+
+INPUTS = {
+    "empty": b"",
+    "one byte": b"a",
+    "two bytes": b"ab",
+    "three bytes": b"abc",
+    "three repeated bytes": b"aaa",
+    "random": _random(6000),
+    "repetitive": b"Mario " * 1500,
+    "zeros": bytes(5000),
+    "longest match": b"x" + b"y" * yaz0.MAX_MATCH,
+    "longer than longest match": b"x" + b"y" * (yaz0.MAX_MATCH * 3 + 1),
+    "match at window size": _window_edge(yaz0.WINDOW_SIZE),
+    "match past window size": _window_edge(yaz0.WINDOW_SIZE + 1),
+    "short matches": bytes(range(256)) * 20,
+}
+
+
+@pytest.mark.parametrize("level", LEVELS)
+@pytest.mark.parametrize("name", INPUTS)
+def test_round_trip(name, level):
+    data = INPUTS[name]
+    compressed = yaz0.compress(data, level)
+    assert libyaz0.decompress(compressed) == data
+
+
+@pytest.mark.parametrize("level", LEVELS)
+def test_header(level):
+    compressed = yaz0.compress(b"abcabcabc", level, alignment=0x80)
+    assert compressed[:4] == b"Yaz0"
+    assert struct.unpack_from(">II", compressed, 4) == (9, 0x80)
+
+
+def test_levels_compress_better():
+    data = bytes(range(256)) * 8 + b"Mario " * 500 + _random(500)
+    sizes = [len(yaz0.compress(data, level)) for level in LEVELS]
+    assert sizes == sorted(sizes, reverse=True)
+    assert sizes[0] > sizes[-1]
+
+
+def test_unknown_level():
+    with pytest.raises(ValueError):
+        yaz0.compress(b"abc", "ultra")
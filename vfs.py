@@ -0,0 +1,132 @@
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+Folders = Dict[str, Dict[str, str]]  # folder -> name key -> name
+
+
+def _key(path: str) -> str:
+    path = os.path.normcase(os.path.normpath(path))
+    return "" if path == os.curdir else path
+
+
+def _scan(root: str, folder: str, folders: Folders) -> Set[str]:
+    files: Set[str] = set()
+    if not root:
+        return files
+    for path, children, names in os.walk(os.path.join(root, folder)):
+        relative = _key(os.path.relpath(path, root))
+        listing = folders.setdefault(relative, {})
+        for name in children + names:
+            listing[_key(name)] = name
+        files.update(_key(os.path.join(relative, name)) for name in names)
+    return files
+
+
+class OverlayFS:
+    """
+    The patches folder laid over the RomFS, indexed in memory.
+
+    Both folders are walked once, on first use. After that lookups, listings
+    and "is this file patched?" questions are answered from sets and dicts.
+    Files the tool writes to the patches folder are reported with add() or
+    refresh() to keep the index current. Patched files deleted behind the
+    tool's back fall back to the RomFS when resolved, reload() walks both
+    folders again.
+    """
+
+    def __init__(self, romfs_path: str = "", patches_path: str = "") -> None:
+        self.romfs_path = romfs_path
+        self.patches_path = patches_path
+        self._lock = threading.RLock()
+        self._romfs: Optional[Set[str]] = None
+        self._romfs_folders: Folders = {}
+        self._patches: Set[str] = set()
+        self._patches_folders: Folders = {}
+        self._scans = 0
+        self._writes: Dict[str, int] = {}
+
+    def use(self, romfs_path: str, patches_path: str) -> None:
+        """Point the overlay at other folders, dropping the index if they changed."""
+        with self._lock:
+            if (romfs_path, patches_path) != (self.romfs_path, self.patches_path):
+                self.romfs_path = romfs_path
+                self.patches_path = patches_path
+                self._romfs = None
+
+    def reload(self) -> None:
+        """Walk both folders again on next use."""
+        with self._lock:
+            self._romfs = None
+
+    def _index(self) -> Set[str]:
+        with self._lock:
+            if self._romfs is None:
+                self._romfs_folders = {}
+                self._romfs = _scan(self.romfs_path, "", self._romfs_folders)
+                self._patches_folders = {}
+                self._patches = _scan(self.patches_path, "", self._patches_folders)
+                self._scans += 1
+            return self._romfs
+
+    def version(self, path: str) -> Tuple[int, int]:
+        """Changes whenever the tool writes path or walks the folders again."""
+        with self._lock:
+            self._index()
+            return self._scans, self._writes.get(_key(path), 0)
+
+    def exists(self, path: str) -> bool:
+        key = _key(path)
+        return key in self._index() or key in self._patches
+
+    def is_overridden(self, path: str) -> bool:
+        self._index()
+        return _key(path) in self._patches
+
+    def resolve(self, path: str) -> str:
+        """The patched copy of a file if there is one, else the RomFS one."""
+        if self.is_overridden(path):
+            patched = os.path.join(self.patches_path, path)
+            if os.path.exists(patched):
+                return patched
+            with self._lock:
+                self._patches.discard(_key(path))
+                self._writes[_key(path)] = self._writes.get(_key(path), 0) + 1
+        return os.path.join(self.romfs_path, path)
+
+    def listdir(self, path: str) -> List[str]:
+        self._index()
+        key = _key(path)
+        names = dict(self._romfs_folders.get(key, {}))
+        names.update(self._patches_folders.get(key, {}))
+        return sorted(names.values())
+
+    def _relative(self, path: str) -> str:
+        if os.path.isabs(path):
+            return os.path.relpath(path, self.patches_path)
+        return path
+
+    def add(self, path: str) -> None:
+        """Record a file written to the patches folder (absolute or relative)."""
+        path = self._relative(path)
+        with self._lock:
+            self._index()
+            self._patches.add(_key(path))
+            self._writes[_key(path)] = self._writes.get(_key(path), 0) + 1
+            folder, name = os.path.split(path)
+            while name:
+                self._patches_folders.setdefault(_key(folder), {})[_key(name)] = name
+                folder, name = os.path.split(folder)
+
+    def refresh(self, folder: str) -> None:
+        """Walk one folder of the patches folder again after bulk changes."""
+        folder = _key(self._relative(folder))
+        prefix = folder + os.sep
+        with self._lock:
+            self._index()
+            self._patches = {i for i in self._patches if not i.startswith(prefix)}
+            for key in list(self._patches_folders):
+                if key == folder or key.startswith(prefix):
+                    del self._patches_folders[key]
+            self._patches |= _scan(self.patches_path, folder, self._patches_folders)
+            self._scans += 1
@@ -0,0 +1,66 @@
+from typing import List, NamedTuple, Optional
+
+
+class ShopRow(NamedTuple):
+    name: str
+    store: str
+    item: dict
+
+
+class StatRow(NamedTuple):
+    key: str
+    search_text: str
+    is_float: bool
+
+
+class MusicRow(NamedTuple):
+    depth: int
+    label: str
+    search_text: str
+    stage: dict
+    scenario: Optional[dict] = None
+    music_info: Optional[dict] = None
+
+    @property
+    def id(self) -> str:
+        return (
+            f"{self.stage['Name']}_{self.scenario['ScenarioNo']}"
+            f"_{self.music_info['Name']}"
+        )
+
+
+def shop_rows(shop_data: list) -> List[ShopRow]:
+    # Items that are sold in several stores share one price, keep one row each.
+    items = {item["ItemName"]: item for item in shop_data}
+    return [
+        ShopRow(item["ItemName"], item.get("StoreName", "All"), item)
+        for item in items.values()
+    ]
+
+
+def stat_rows(player_const: dict) -> List[StatRow]:
+    import byml
+
+    rows = []
+    for key, value in player_const.items():
+        if isinstance(value, (byml.Float, byml.Double)):
+            rows.append(StatRow(key, key.lower(), True))
+        elif isinstance(value, (byml.Int, byml.Int64)):
+            rows.append(StatRow(key, key.lower(), False))
+    return rows
+
+
+def music_rows(bgm_stage_info_list: dict) -> List[MusicRow]:
+    rows = []
+    for stage in bgm_stage_info_list["StageInfoList"]:
+        rows.append(MusicRow(0, stage["Name"], stage["Name"].lower(), stage))
+        for scenario in stage["StageScenarioInfoList"]:
+            label = f"Scenario Number: {scenario['ScenarioNo']}"
+            rows.append(MusicRow(1, label, label.lower(), stage, scenario))
+            for music_info in scenario["StagePlayInfoList"]:
+                label = f"Name: {music_info['Name']}"
+                search_text = f"{music_info['Name']} {music_info['ResourceName']}"
+                rows.append(
+                    MusicRow(2, label, search_text.lower(), stage, scenario, music_info)
+                )
+    return rows
@@ -0,0 +1,176 @@
+import struct
+from typing import Dict, Literal, NamedTuple, Union
+
+Level = Literal["store", "fast", "balanced", "max"]
+
+WINDOW_SIZE = 0x1000
+MIN_MATCH = 3
+MAX_MATCH = 0x111
+
+
+class LevelSettings(NamedTuple):
+    max_chain: int  # How many earlier positions to try per match search
+    nice_length: int  # Stop searching once a match is at least this long
+    lazy: bool  # Try one byte ahead before committing to a match
+
+
+LEVELS: Dict[str, LevelSettings] = {
+    "store": LevelSettings(0, 0, False),
+    "fast": LevelSettings(4, 32, False),
+    "balanced": LevelSettings(32, 128, True),
+    "max": LevelSettings(WINDOW_SIZE, MAX_MATCH, True),
+}
+
+
+def _match_length(data: bytes, candidate: int, pos: int, limit: int) -> int:
+    length = 0
+    # Compare in slices first, only the tail is compared byte by byte.
+    while length + 16 <= limit and (
+        data[candidate + length : candidate + length + 16]
+        == data[pos + length : pos + length + 16]
+    ):
+        length += 16
+    while length < limit and data[candidate + length] == data[pos + length]:
+        length += 1
+    return length
+
+
+class _MatchFinder:
+    """Hash chains over 3-byte prefixes, limited to the Yaz0 window."""
+
+    def __init__(self, data: bytes, settings: LevelSettings) -> None:
+        self.data = data
+        self.settings = settings
+        self.head: Dict[bytes, int] = {}
+        self.prev = [-1] * len(data)
+        self.inserted = 0
+
+    def insert_until(self, end: int) -> None:
+        data = self.data
+        head = self.head
+        prev = self.prev
+        last = len(data) - MIN_MATCH + 1
+        for pos in range(self.inserted, min(end, last)):
+            key = data[pos : pos + MIN_MATCH]
+            prev[pos] = head.get(key, -1)
+            head[key] = pos
+        self.inserted = max(self.inserted, end)
+
+    def find(self, pos: int):
+        data = self.data
+        limit = min(MAX_MATCH, len(data) - pos)
+        if limit < MIN_MATCH:
+            return 0, 0
+        self.insert_until(pos)
+        candidate = self.head.get(data[pos : pos + MIN_MATCH], -1)
+        window_start = pos - WINDOW_SIZE
+        best_length = 0
+        best_pos = 0
+        chain = self.settings.max_chain
+        nice_length = min(self.settings.nice_length, limit)
+        prev = self.prev
+        while candidate >= window_start and candidate >= 0 and chain > 0:
+            chain -= 1
+            # A candidate can only win if it also matches the byte after the
+            # current best, so check that before doing a full comparison.
+            if (
+                best_length == 0
+                or data[candidate + best_length] == data[pos + best_length]
+            ):
+                length = _match_length(data, candidate, pos, limit)
+                if length > best_length:
+                    best_length = length
+                    best_pos = candidate
+                    if length >= nice_length:
+                        break
+            candidate = prev[candidate]
+        if best_length < MIN_MATCH:
+            return 0, 0
+        return best_pos, best_length
+
+
+def _store(data: bytes) -> bytes:
+    out = bytearray()
+    for i in range(0, len(data), 8):
+        out.append(0xFF)
+        out += data[i : i + 8]
+    return bytes(out)
+
+
+def _encode(data: bytes, settings: LevelSettings) -> bytes:
+    out = bytearray()
+    finder = _MatchFinder(data, settings)
+    size = len(data)
+    pos = 0
+    flags_pos = 0
+    flags = 0
+    count = 8
+    pending = None
+    while pos < size:
+        if count == 8:
+            if pos:
+                out[flags_pos] = flags
+            flags_pos = len(out)
+            out.append(0)
+            flags = 0
+            count = 0
+
+        if pending is not None:
+            match_pos, length = pending
+            pending = None
+        else:
+            match_pos, length = finder.find(pos)
+        if (
+            length
+            and settings.lazy
+            and length < settings.nice_length
+            and pos + 1 < size
+        ):
+            next_pos, next_length = finder.find(pos + 1)
+            if next_length > length:
+                pending = (next_pos, next_length)
+                length = 0
+
+        if length:
+            distance = pos - match_pos - 1
+            if length < 0x12:
+                out.append((length - 2) << 4 | distance >> 8)
+                out.append(distance & 0xFF)
+            else:
+                out.append(distance >> 8)
+                out.append(distance & 0xFF)
+                out.append(length - 0x12)
+            pos += length
+        else:
+            flags |= 0x80 >> count
+            out.append(data[pos])
+            pos += 1
+        count += 1
+    if size:
+        out[flags_pos] = flags
+    return bytes(out)
+
+
+def compress(
+    data: Union[bytes, bytearray, memoryview],
+    level: Level = "balanced",
+    alignment: int = 0,
+) -> bytes:
+    """
+    Yaz0 compress data.
+
+    "store" writes literals only (no search at all), "fast" and "balanced" use
+    short hash chains, "max" searches the whole 4 KiB window with lazy matching.
+    """
+    try:
+        settings = LEVELS[level]
+    except KeyError:
+        raise ValueError(f"Unknown compression level: {level}") from None
+    data = bytes(data)
+    header = b"Yaz0" + struct.pack(">II", len(data), alignment) + b"\0" * 4
+    if not data:
+        # Some decoders read the first flag byte before checking the size.
+        return header + b"\0"
+    if not settings.max_chain:
+        return header + _store(data)
+    return header + _encode(data, settings)